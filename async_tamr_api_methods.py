@@ -0,0 +1,185 @@
+import json
+import types
+import base64
+import asyncio
+import logging
+import aiohttp
+
+
+def async_check_status(success_code=200, silent=False):
+    """
+    Same as tamr_api_methods.check_status, for coroutines returning an
+    AsyncResponse. Raises AssertionError if the status code does not
+    match success_code.
+    :param success_code: Response code of the API call, default is 200
+    :param silent: Disables logging if True, default is False
+    :return: AsyncResponse object
+    """
+
+    def decorator(api_call_function):
+
+        async def wrapper(*args, **kwargs):
+            response = await api_call_function(*args, **kwargs)
+            if response.status_code != success_code:
+                logging.info("Called %s %s",
+                             response.request.method,
+                             response.request.url)
+                logging.error("ERROR: Status code = {0}".format(response.status_code))
+                logging.error("Request body:")
+                logging.error(response.request.body)
+                logging.error("Response:")
+                logging.error(json.dumps(response.text))
+                raise AssertionError("Status code {0} != {1}".format(response.status_code, success_code))
+            if not silent:
+                logging.info("Called %s %s",
+                             response.request.method, response.request.url)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+class AsyncResponse(object):
+    """
+    Response of an AsyncTamrAPI call. The body is read before the
+    connection is released, so it can be used after the call returns.
+    """
+
+    def __init__(self, method, url, body, status_code, text):
+        self.request = types.SimpleNamespace(method=method, url=url, body=body)
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncTamrAPI(object):
+    """
+    asyncio variant of TamrAPI for cluster curation, so that many
+    operations can be in flight at once from a single process. At most
+    max_concurrency requests are sent at a time; the rest wait.
+
+    async with AsyncTamrAPI(host, protocol, port, user, pw) as api:
+        responses = await asyncio.gather(*[api.merge_clusters(...) for ... in decisions])
+    """
+
+    def __init__(self,
+                 host, protocol, port,
+                 user, pw,
+                 max_concurrency=50, timeout=None):
+        """
+        :param max_concurrency: Maximum number of requests in flight, also the size of the connection pool
+        :param timeout: Total timeout of a request in seconds, None waits forever
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.pw = pw
+        self.api_url = '/api'
+        self.protocol = protocol
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.base_url = '{0}://{1}:{2}{3}'.format(protocol, host, port, self.api_url)
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        token = base64.b64encode('{0}:{1}'.format(self.user, self.pw).encode('utf-8')).decode('ascii')
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                             headers={'Authorization': 'BasicCreds {}'.format(token)})
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *args):
+        await self.session.close()
+        self.session = None
+
+    async def request(self, method, endpoint, params=None, json_body=None, data=None, headers=None):
+        """
+        Sends a request once a slot is free and reads the whole response.
+        :return: AsyncResponse object
+        """
+        if json_body is not None:
+            data = json.dumps(json_body)
+            headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        async with self.semaphore:
+            async with self.session.request(method, self.base_url + endpoint,
+                                            params=params, data=data, headers=headers) as response:
+                text = await response.text()
+                return AsyncResponse(method, str(response.url), data, response.status, text)
+
+    @async_check_status(success_code=200)
+    async def health(self):
+        return await self.request('GET', '/service/health')
+
+    @async_check_status(success_code=200)
+    async def get_cluster_ids(self, unified_dataset_name, query='', offset='', limit='', sort='', cluster_ids='', name=''):
+        return await self.request('GET', '/dedup/clusters/{}'.format(unified_dataset_name),
+                                  params={'q': query,
+                                          'offset': offset,
+                                          'limit': limit,
+                                          'sort': sort,
+                                          'clusterIds': cluster_ids,
+                                          'name': name
+                                          })
+
+    async def split_cluster(self, unified_dataset_name, cluster_name_field, json_file_path):
+        """
+        Sends one move-to-new request per line of the JSON file, concurrently.
+        A failed move does not cancel the others, since moves already sent
+        cannot be undone; every move's outcome is returned instead.
+        :return: list with, per non-blank line and in their order, the
+                 AsyncResponse or the exception raised by that move
+        """
+        with open(json_file_path, 'r') as json_file:
+            rows = [row for row in json_file if row.strip()]
+        results = await asyncio.gather(*[self.move_to_new_cluster(unified_dataset_name, cluster_name_field, row)
+                                         for row in rows], return_exceptions=True)
+        for line, result in enumerate(results):
+            if isinstance(result, BaseException):
+                logging.error("Error moving records on line {0}: {1!r}".format(line, result))
+        return results
+
+    @async_check_status(success_code=200)
+    async def move_to_new_cluster(self, unified_dataset_name, cluster_name_field, body):
+        return await self.request('POST', '/dedup/clusters/{}/move-to-new'.format(unified_dataset_name),
+                                  headers={'Content-Type': 'application/json'},
+                                  params={"clusterNameField": cluster_name_field},
+                                  data=body)
+
+    @async_check_status(success_code=200)
+    async def assign_clusters(self, unified_dataset_name, usernames, cluster_ids):
+        return await self.request('POST', '/dedup/clusters/{}/feedback'.format(unified_dataset_name),
+                                  json_body={"usernames": usernames,
+                                             "clusterIds": cluster_ids
+                                             })
+
+    @async_check_status(success_code=200)
+    async def unassign_clusters(self, unified_dataset_name, usernames, cluster_ids):
+        return await self.request('DELETE', '/dedup/clusters/{}/feedback'.format(unified_dataset_name),
+                                  json_body={"usernames": usernames,
+                                             "clusterIds": cluster_ids
+                                             })
+
+    @async_check_status(success_code=200)
+    async def merge_clusters(self, unified_dataset_name, cluster_name_field, target_cluster_id, cluster_ids_to_merge):
+        return await self.request('POST', '/dedup/clusters/{}/merge'.format(unified_dataset_name),
+                                  params={'clusterNameField': cluster_name_field},
+                                  json_body={'targetCluster': target_cluster_id,
+                                             'clustersToMerge': cluster_ids_to_merge
+                                             })
+
+    @async_check_status(success_code=200)
+    async def get_records_in_cluster(self, unified_dataset_name, cluster_id, sort_by_spend='false', limit=100):
+        return await self.request('GET', '/transactions/{}'.format(unified_dataset_name),
+                                  params={'sortBySpend': sort_by_spend,
+                                          'suppliers': cluster_id,
+                                          'limit': limit})
+
+    @async_check_status(success_code=200)
+    async def get_assigned_clusters(self):
+        return await self.request('GET', '/dedup/clusters/feedback',
+                                  headers={'Content-Type': 'application/json'})
@@ -0,0 +1,418 @@
+import os
+import json
+import mmap
+import heapq
+import struct
+import tempfile
+from array import array
+from operator import itemgetter
+
+# Entry of a sorted run: length of the record id and cluster code, followed by the record id
+RUN_ENTRY = struct.Struct('<II')
+
+# Number of records sorted in memory at a time while building a store
+DEFAULT_RUN_SIZE = 5000000
+
+
+def write_run(entries, run_path):
+    entries.sort(key=itemgetter(0))
+    with open(run_path, 'wb', buffering=1024 * 1024) as f:
+        for record_id, code in entries:
+            f.write(RUN_ENTRY.pack(len(record_id), code))
+            f.write(record_id)
+
+
+def read_run(run_path):
+    with open(run_path, 'rb', buffering=1024 * 1024) as f:
+        while True:
+            header = f.read(RUN_ENTRY.size)
+            if not header:
+                return
+            length, code = RUN_ENTRY.unpack(header)
+            yield f.read(length), code
+
+
+def write_strings(strings, data_path, offsets_path):
+    """
+    Writes byte strings back to back to data_path and their boundaries,
+    as len(strings) + 1 uint64 offsets, to offsets_path.
+    """
+    offsets = array('Q', [0])
+    with open(data_path, 'wb') as data:
+        for string in strings:
+            data.write(string)
+            offsets.append(offsets[-1] + len(string))
+    with open(offsets_path, 'wb') as f:
+        offsets.tofile(f)
+
+
+class ClusterStore(object):
+    """
+    Read-only map of recordId -> clusterId stored on disk and memory-mapped,
+    so that cluster exports much larger than memory can be looked up.
+
+    Files in the store directory:
+      records.dat, records.idx   record ids, sorted, and their uint64 offsets
+      codes.dat                  uint32 cluster code of each record, in record order
+      clusters.dat, clusters.idx cluster ids, sorted; a cluster's code is its position
+      members.dat, members.idx   uint32 record positions grouped by cluster code, and
+                                 the uint64 offset of each cluster's group
+
+    Record ids are looked up by binary search, and the records of a cluster
+    are read from its group, so neither needs an index in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.num_records = meta['records']
+        self.num_clusters = meta['clusters']
+        self.files = []
+        self.records = self.open_map('records.dat', None)
+        self.record_offsets = self.open_map('records.idx', 'Q')
+        self.codes = self.open_map('codes.dat', 'I')
+        self.cluster_ids = self.open_map('clusters.dat', None)
+        self.cluster_offsets = self.open_map('clusters.idx', 'Q')
+        self.members = self.open_map('members.dat', 'I')
+        self.member_offsets = self.open_map('members.idx', 'Q')
+
+    def open_map(self, name, typecode):
+        """
+        Memory-maps a file of the store, as bytes or as a memoryview of typecode.
+        """
+        f = open(os.path.join(self.path, name), 'rb')
+        self.files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            data = b''
+        else:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.files.append(data)
+        if typecode is None:
+            return data
+        return memoryview(data).cast(typecode)
+
+    @classmethod
+    def build(cls, clusters, path, run_size=DEFAULT_RUN_SIZE):
+        """
+        Builds a store from a stream of clusters, as from generate_clusters.
+        Records are sorted in runs of run_size on disk and merged, so memory
+        use is bounded by run_size and the number of distinct clusters.
+        If a recordId occurs more than once, the last clusterId wins.
+        :param clusters: Iterable of dicts with recordId and clusterId
+        :param path: Directory to write the store to, created if needed
+        :param run_size: Number of records sorted in memory at a time
+        :return: ClusterStore
+        """
+        os.makedirs(path, exist_ok=True)
+        codes = {}
+        cluster_ids = []
+        with tempfile.TemporaryDirectory(dir=path) as tmp_dir:
+            run_paths = []
+            entries = []
+            for cluster in clusters:
+                cluster_id = cluster['clusterId']
+                code = codes.get(cluster_id)
+                if code is None:
+                    code = codes[cluster_id] = len(cluster_ids)
+                    cluster_ids.append(cluster_id)
+                entries.append((str(cluster['recordId']).encode('utf-8'), code))
+                if len(entries) >= run_size:
+                    run_paths.append(os.path.join(tmp_dir, 'run{}'.format(len(run_paths))))
+                    write_run(entries, run_paths[-1])
+                    entries = []
+            if entries:
+                run_paths.append(os.path.join(tmp_dir, 'run{}'.format(len(run_paths))))
+                write_run(entries, run_paths[-1])
+            entries = None
+            codes = None
+
+            # Renumber clusters in sorted order, so cluster ids can be binary searched
+            order = sorted(range(len(cluster_ids)), key=cluster_ids.__getitem__)
+            recode = array('I', bytes(4 * len(order)))
+            for new_code, old_code in enumerate(order):
+                recode[old_code] = new_code
+            write_strings((cluster_ids[old_code].encode('utf-8') for old_code in order),
+                          os.path.join(path, 'clusters.dat'), os.path.join(path, 'clusters.idx'))
+            num_clusters = len(order)
+            order = None
+            cluster_ids = None
+
+            # Merge runs into the sorted record files. heapq.merge is stable,
+            # so repeated record ids come out in stream order.
+            counts = array('Q', bytes(8 * num_clusters))
+            num_records = 0
+            merged = heapq.merge(*[read_run(run_path) for run_path in run_paths], key=itemgetter(0))
+            with open(os.path.join(path, 'records.dat'), 'wb', buffering=1024 * 1024) as records_file, \
+                    open(os.path.join(path, 'records.idx'), 'wb') as offsets_file, \
+                    open(os.path.join(path, 'codes.dat'), 'wb') as codes_file:
+                offsets = array('Q', [0])
+                record_codes = array('I')
+                previous = None
+                previous_code = None
+                for record_id, code in merged:
+                    if record_id != previous and previous is not None:
+                        records_file.write(previous)
+                        offsets.append(offsets[-1] + len(previous))
+                        record_codes.append(previous_code)
+                        counts[previous_code] += 1
+                        num_records += 1
+                        if len(record_codes) >= DEFAULT_RUN_SIZE:
+                            offsets[:-1].tofile(offsets_file)
+                            del offsets[:-1]
+                            record_codes.tofile(codes_file)
+                            record_codes = array('I')
+                    previous = record_id
+                    previous_code = recode[code]
+                if previous is not None:
+                    records_file.write(previous)
+                    offsets.append(offsets[-1] + len(previous))
+                    record_codes.append(previous_code)
+                    counts[previous_code] += 1
+                    num_records += 1
+                offsets.tofile(offsets_file)
+                record_codes.tofile(codes_file)
+        assert num_records < 2 ** 32, "Too many records for uint32 positions"
+
+        # Group record positions by cluster
+        member_offsets = array('Q', [0])
+        for count in counts:
+            member_offsets.append(member_offsets[-1] + count)
+        with open(os.path.join(path, 'members.idx'), 'wb') as f:
+            member_offsets.tofile(f)
+        cursors = member_offsets[:-1]
+        member_offsets = None
+        counts = None
+        with open(os.path.join(path, 'members.dat'), 'wb+') as f:
+            if num_records:
+                f.truncate(4 * num_records)
+                with mmap.mmap(f.fileno(), 0) as members_map, \
+                        open(os.path.join(path, 'codes.dat'), 'rb') as codes_file:
+                    members = memoryview(members_map).cast('I')
+                    position = 0
+                    while True:
+                        record_codes = array('I')
+                        try:
+                            record_codes.fromfile(codes_file, DEFAULT_RUN_SIZE)
+                        except EOFError:
+                            pass
+                        if not record_codes:
+                            break
+                        for code in record_codes:
+                            members[cursors[code]] = position
+                            cursors[code] += 1
+                            position += 1
+                    members.release()
+
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'records': num_records, 'clusters': num_clusters}, f)
+        return cls(path)
+
+    def close(self):
+        for view in (self.record_offsets, self.codes, self.cluster_offsets, self.members, self.member_offsets):
+            view.release()
+        for f in reversed(self.files):
+            f.close()
+        self.files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record_id(self, position):
+        return self.records[self.record_offsets[position]:self.record_offsets[position + 1]].decode('utf-8')
+
+    def cluster_id(self, code):
+        return self.cluster_ids[self.cluster_offsets[code]:self.cluster_offsets[code + 1]].decode('utf-8')
+
+    @staticmethod
+    def search(data, offsets, count, key):
+        """
+        Binary search for key in count sorted strings stored in data at offsets.
+        :return: Position of key, or -1 if it is not there
+        """
+        key = key.encode('utf-8')
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if data[offsets[middle]:offsets[middle + 1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < count and data[offsets[low]:offsets[low + 1]] == key:
+            return low
+        return -1
+
+    def get(self, record_id, default=None):
+        position = self.search(self.records, self.record_offsets, self.num_records, record_id)
+        if position < 0:
+            return default
+        return self.cluster_id(self.codes[position])
+
+    def __getitem__(self, record_id):
+        cluster_id = self.get(record_id)
+        if cluster_id is None:
+            raise KeyError(record_id)
+        return cluster_id
+
+    def __contains__(self, record_id):
+        return self.search(self.records, self.record_offsets, self.num_records, record_id) >= 0
+
+    def __len__(self):
+        return self.num_records
+
+    def __iter__(self):
+        for position in range(self.num_records):
+            yield self.record_id(position)
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        """
+        Iterates over (recordId, clusterId) in recordId order.
+        """
+        for position in range(self.num_records):
+            yield self.record_id(position), self.cluster_id(self.codes[position])
+
+    def clusters(self):
+        """
+        Iterates over cluster ids in sorted order.
+        """
+        for code in range(self.num_clusters):
+            yield self.cluster_id(code)
+
+    def cluster_records(self, cluster_id):
+        """
+        Returns the record ids in a cluster, in recordId order.
+        :param cluster_id: Cluster id
+        :return: list of record ids, empty if the cluster is not in the store
+        """
+        code = self.search(self.cluster_ids, self.cluster_offsets, self.num_clusters, cluster_id)
+        if code < 0:
+            return []
+        return [self.record_id(self.members[position])
+                for position in range(self.member_offsets[code], self.member_offsets[code + 1])]
+
+
+class CompactClusterMap(object):
+    """
+    In-memory map of recordId -> clusterId that uses a fraction of the
+    memory of a dict of strings. Cluster ids are interned into a table and
+    referenced by uint32 code, record ids are stored back to back in one
+    bytearray, and lookups go through an open-addressing hash table of
+    record positions. Same read interface as ClusterStore.
+    """
+
+    def __init__(self):
+        self.cluster_ids = []
+        self.cluster_codes = {}
+        self.records = bytearray()
+        self.record_offsets = array('Q', [0])
+        self.codes = array('I')
+        # Position + 1 of the record in each slot, 0 for an empty slot
+        self.table = array('I', bytes(4 * 8))
+        self.mask = 7
+
+    @classmethod
+    def from_clusters(cls, clusters):
+        """
+        Builds a map from a stream of clusters, as from generate_clusters.
+        If a recordId occurs more than once, the last clusterId wins.
+        :param clusters: Iterable of dicts with recordId and clusterId
+        :return: CompactClusterMap
+        """
+        cluster_map = cls()
+        for cluster in clusters:
+            cluster_map.add(str(cluster['recordId']), cluster['clusterId'])
+        return cluster_map
+
+    def record_key(self, position):
+        return bytes(self.records[self.record_offsets[position]:self.record_offsets[position + 1]])
+
+    def find_slot(self, key):
+        """
+        Returns the slot of key in the hash table, or of the empty slot where it would go.
+        """
+        table = self.table
+        slot = hash(key) & self.mask
+        while table[slot] and self.record_key(table[slot] - 1) != key:
+            slot = (slot + 1) & self.mask
+        return slot
+
+    def add(self, record_id, cluster_id):
+        code = self.cluster_codes.get(cluster_id)
+        if code is None:
+            code = self.cluster_codes[cluster_id] = len(self.cluster_ids)
+            self.cluster_ids.append(cluster_id)
+        key = record_id.encode('utf-8')
+        slot = self.find_slot(key)
+        if self.table[slot]:
+            self.codes[self.table[slot] - 1] = code
+            return
+        self.records += key
+        self.record_offsets.append(len(self.records))
+        self.codes.append(code)
+        self.table[slot] = len(self.codes)
+        # Keep the table at most half full so probe sequences stay short
+        if 2 * len(self.codes) > len(self.table):
+            self.resize(2 * len(self.table))
+
+    def resize(self, size):
+        self.table = array('I', bytes(4 * size))
+        self.mask = size - 1
+        for position in range(len(self.codes)):
+            self.table[self.find_slot(self.record_key(position))] = position + 1
+
+    def get(self, record_id, default=None):
+        position = self.table[self.find_slot(record_id.encode('utf-8'))]
+        if not position:
+            return default
+        return self.cluster_ids[self.codes[position - 1]]
+
+    def __getitem__(self, record_id):
+        cluster_id = self.get(record_id)
+        if cluster_id is None:
+            raise KeyError(record_id)
+        return cluster_id
+
+    def __contains__(self, record_id):
+        return self.table[self.find_slot(record_id.encode('utf-8'))] != 0
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        for position in range(len(self.codes)):
+            yield self.record_key(position).decode('utf-8')
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        """
+        Iterates over (recordId, clusterId) in the order records were first added.
+        """
+        for position in range(len(self.codes)):
+            yield self.record_key(position).decode('utf-8'), self.cluster_ids[self.codes[position]]
+
+    def clusters(self):
+        """
+        Iterates over cluster ids in the order they were first seen.
+        """
+        return iter(self.cluster_ids)
+
+    def cluster_records(self, cluster_id):
+        """
+        Returns the record ids in a cluster. Scans all records, so use a
+        ClusterStore for many reverse lookups.
+        :param cluster_id: Cluster id
+        :return: list of record ids, empty if the cluster is not in the map
+        """
+        code = self.cluster_codes.get(cluster_id)
+        if code is None:
+            return []
+        return [self.record_key(position).decode('utf-8')
+                for position, record_code in enumerate(self.codes) if record_code == code]
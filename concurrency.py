@@ -0,0 +1,40 @@
+import collections
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+def bounded_starmap(executor, function, arguments, max_pending, ordered=True):
+    """
+    Calls function(*args) on executor for each tuple of args and yields the
+    results. Unlike Executor.map, calls are only submitted while fewer than
+    max_pending are waiting to be yielded, so a long or lazy iterable of
+    arguments is never submitted, nor its results held, all at once.
+    Calls still pending are cancelled when the generator is closed or a
+    call raises.
+    :param executor: ThreadPoolExecutor or ProcessPoolExecutor
+    :param function: Function to call, module level for a process pool
+    :param arguments: Iterable of tuples of positional arguments
+    :param max_pending: Maximum number of calls submitted but not yet yielded
+    :param ordered: Yield results in the order of arguments. If False, they
+                    are yielded as soon as they are ready.
+    :return: Generator of results of function
+    """
+    arguments = iter(arguments)
+    pending = collections.deque()
+    try:
+        while True:
+            for args in arguments:
+                pending.append(executor.submit(function, *args))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                return
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                pending = collections.deque(not_done)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
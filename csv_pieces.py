@@ -0,0 +1,191 @@
+import io
+import os
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from common.concurrency import bounded_starmap
+
+# Approximate size in bytes of the pieces a csv is split into for parallel parsing
+DEFAULT_PIECE_SIZE = 16 * 1024 * 1024
+
+# Size in bytes of each read while scanning a csv for record boundaries
+DEFAULT_SCAN_SIZE = 8 * 1024 * 1024
+
+# Appended to a piece before parsing, it comes back as a row of its own
+# only if the piece ends outside a quoted field
+PIECE_END = '\x1e'
+
+
+class CsvSplitError(ValueError):
+    """
+    Raised when a piece of a csv does not end on a record boundary. split_csv
+    counts quote characters, so a quote inside an unquoted field, e.g.
+    12" pipe, which csv.reader reads as a literal, can make it split inside
+    a later quoted field. The csv has to be parsed serially from start.
+    """
+
+    def __init__(self, start, end):
+        super().__init__(start, end)
+        self.start = start
+        self.end = end
+
+    def __str__(self):
+        return 'Piece {0}-{1} of csv does not end on a record boundary'.format(self.start, self.end)
+
+
+def csv_field_index(fieldnames, field):
+    """
+    Returns the position of field in a csv header. With repeated column
+    names csv.DictReader keeps the value of the last one, so this does too.
+    """
+    return len(fieldnames) - 1 - fieldnames[::-1].index(field)
+
+
+def split_csv(file_path, piece_size=DEFAULT_PIECE_SIZE, quotechar='"', read_size=DEFAULT_SCAN_SIZE):
+    """
+    Splits a csv into pieces of roughly piece_size bytes that start and end
+    on record boundaries, so they can be parsed independently. A newline is
+    only a record boundary if an even number of quote characters precede
+    it, so quoted fields containing newlines are never split. A quote
+    inside an unquoted field breaks this, so parse the header and pieces
+    with csv_header_fields and iter_piece_rows, which raise CsvSplitError
+    at the first wrong boundary. Assumes an ASCII-compatible encoding such
+    as utf-8 or latin-1.
+    :param file_path: Path to csv
+    :param piece_size: Approximate size of each piece in bytes
+    :param quotechar: Quote character of the csv, default is '"'
+    :param read_size: Size in bytes of each read from the file
+    :return: tuple of header bytes and list of (start, end) byte offsets of the pieces
+    """
+    quote = quotechar.encode('ascii')
+    header = None
+    pieces = []
+    start = 0
+    target = 0
+    position = 0
+    quotes = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(read_size)
+            if not block:
+                break
+            searched = max(0, target - position)
+            block_quotes = quotes + block.count(quote, 0, searched)
+            while searched < len(block):
+                newline = block.find(b'\n', searched)
+                if newline == -1:
+                    break
+                block_quotes += block.count(quote, searched, newline)
+                searched = newline + 1
+                if block_quotes % 2:
+                    continue
+                boundary = position + searched
+                if header is None:
+                    f.seek(0)
+                    header = f.read(boundary)
+                    f.seek(position + len(block))
+                elif boundary > start:
+                    pieces.append((start, boundary))
+                start = boundary
+                target = boundary + piece_size
+                if target - position >= len(block):
+                    break
+                block_quotes += block.count(quote, searched, target - position)
+                searched = target - position
+            quotes += block.count(quote)
+            position += len(block)
+    if header is None:
+        # Header without a trailing newline, no records
+        with open(file_path, 'rb') as f:
+            return f.read(), []
+    if position > start:
+        pieces.append((start, position))
+    return header, pieces
+
+
+def read_csv_piece(file_path, start, end, encoding='utf-8'):
+    """
+    Returns the text of a piece of a csv, as from split_csv.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start).decode(encoding)
+
+
+def checked_csv_rows(text, start, end, newline='', **fmtparams):
+    """
+    Parses the text of a piece of a csv with csv.reader and yields its rows.
+    Once they are exhausted, raises CsvSplitError if the piece ended inside
+    a quoted field, as it does when split_csv cut it at a wrong boundary.
+    :param text: Text of the piece
+    :param start: Byte offset of the piece, for the error
+    :param end: Byte offset of the end of the piece, for the error
+    :param newline: Newline translation of the text, as for open()
+    :param fmtparams: Passed to csv.reader, e.g. delimiter
+    :return: Generator of lists of values
+    """
+    if text and text[-1] not in '\r\n':
+        text += '\n'
+    rows = csv.reader(io.StringIO(text + PIECE_END, newline=newline), **fmtparams)
+    try:
+        previous = next(rows)
+        for row in rows:
+            yield previous
+            previous = row
+    except csv.Error as e:
+        # e.g. a field larger than the limit, which a wrong boundary can make.
+        # A serial parse raises it again if it is really in the csv.
+        raise CsvSplitError(start, end) from e
+    if previous != [PIECE_END]:
+        raise CsvSplitError(start, end)
+
+
+def iter_piece_rows(file_path, start, end, encoding='utf-8', newline='', **fmtparams):
+    """
+    Same as checked_csv_rows, for a piece of a csv as from split_csv.
+    """
+    text = read_csv_piece(file_path, start, end, encoding=encoding)
+    return checked_csv_rows(text, start, end, newline=newline, **fmtparams)
+
+
+def csv_header_fields(header, encoding='utf-8', **fmtparams):
+    """
+    Parses the header bytes from split_csv.
+    :return: list of field names, None if the csv is empty. Raises
+             CsvSplitError if the header is not a complete record.
+    """
+    rows = list(checked_csv_rows(header.decode(encoding), 0, len(header), **fmtparams))
+    return rows[0] if rows else None
+
+
+def open_csv_at(file_path, offset, encoding='utf-8', newline=''):
+    """
+    Opens a csv as text from a byte offset, e.g. the start of a piece from
+    split_csv, to parse the rest of it serially.
+    """
+    f = open(file_path, 'rb')
+    f.seek(offset)
+    return io.TextIOWrapper(f, encoding=encoding, newline=newline)
+
+
+def map_csv_pieces(function, file_path, pieces, args=(), processes=None, ordered=True):
+    """
+    Calls function(file_path, *piece, *args) for every piece over a
+    process pool and yields the results. At most 2 * processes results are
+    held in memory at a time.
+    :param function: Module level function, so it can be sent to other processes
+    :param file_path: Path to csv
+    :param pieces: List of (start, end), as from split_csv, optionally followed
+                   by more values specific to each piece
+    :param args: Additional arguments passed to function
+    :param processes: Number of processes, default is the number of cpus
+    :param ordered: Yield results in the order of pieces. If False, they are
+                    yielded as soon as they are ready. If ordered, an error
+                    raised for a piece, e.g. CsvSplitError, comes after the
+                    results of all pieces before it.
+    :return: Generator of results of function
+    """
+    processes = processes or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        yield from bounded_starmap(executor, function,
+                                   ((file_path,) + tuple(piece) + tuple(args) for piece in pieces),
+                                   2 * processes, ordered=ordered)
@@ -3,9 +3,18 @@ from common.tamr_api_methods import TamrAPI
 
 def get_cluster_ids(host, protocol, port, username, password,
                     unified_dataset_name, query='', offset='',
-                    limit='', sort='', cluster_ids='', name=''):
+                    limit='', sort='', cluster_ids='', name='',
+                    all_pages=False, page_size=1000, workers=4):
 
-    with TamrAPI(host, protocol, port, username, password) as api:
+    with TamrAPI(host, protocol, port, username, password, pool_size=workers if all_pages else None) as api:
+        if all_pages:
+            # offset, limit and cluster_ids do not apply to the whole listing
+            return list(api.iter_cluster_ids(unified_dataset_name=unified_dataset_name,
+                                             query=query,
+                                             sort=sort,
+                                             name=name,
+                                             page_size=page_size,
+                                             workers=workers))
         response = api.get_cluster_ids(unified_dataset_name=unified_dataset_name,
                                        query=query,
                                        offset=offset,
@@ -43,6 +52,12 @@ if __name__ == '__main__':
                         help='Cluster IDs', default='')
     parser.add_argument('--name', type=str, required=False,
                         help='Cluster Name', default='')
+    parser.add_argument('--all_pages', action='store_true',
+                        help='Fetch all clusters matching the query, a page at a time')
+    parser.add_argument('--page_size', type=int, default=1000,
+                        help='Clusters per request with --all_pages, defaults to 1000')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Concurrent requests with --all_pages, defaults to 4')
 
     args = parser.parse_args()
     get_cluster_ids(host=args.host,
@@ -56,4 +71,7 @@ if __name__ == '__main__':
                     limit=args.limit,
                     sort=args.sort,
                     cluster_ids=args.cluster_ids,
-                    name=args.name)
+                    name=args.name,
+                    all_pages=args.all_pages,
+                    page_size=args.page_size,
+                    workers=args.workers)
@@ -3,7 +3,19 @@ from common.tamr_api_methods import TamrAPI
 
 
 def get_records_in_cluster(host, protocol, port, username, password,
-                   unified_dataset_name, cluster_id, sort_by_spend='false', limit=100):
+                   unified_dataset_name, cluster_id, sort_by_spend='false', limit=100,
+                   cluster_ids_filepath=None, workers=8):
+
+    if cluster_ids_filepath:
+        # One cluster id per line, records of all clusters are returned as a dict
+        with open(cluster_ids_filepath, 'r') as f:
+            cluster_ids = [line.strip() for line in f if line.strip()]
+        with TamrAPI(host, protocol, port, username, password, pool_size=workers) as api:
+            return dict(api.get_records_in_clusters(unified_dataset_name=unified_dataset_name,
+                                                    cluster_ids=cluster_ids,
+                                                    sort_by_spend=sort_by_spend,
+                                                    limit=limit,
+                                                    workers=workers))
 
     with TamrAPI(host, protocol, port, username, password) as api:
         response = api.get_records_in_cluster(unified_dataset_name=unified_dataset_name,
@@ -28,12 +40,16 @@ if __name__ == '__main__':
                         help='Unify Password')
     parser.add_argument('--unified_dataset_name', type=str, required=True,
                         help='Name of the unified dataset')
-    parser.add_argument('--cluster_id', type=str, required=True,
-                        help='Cluster ID')
+    parser.add_argument('--cluster_id', type=str,
+                        help='Cluster ID, required unless --cluster_ids_filepath is set')
     parser.add_argument('--sort_by_spend', type=str, default='false',
                         help='Sort by spend, default is false')
     parser.add_argument('--limit', type=int, default=100,
                         help='Record limit, default is 100')
+    parser.add_argument('--cluster_ids_filepath', type=str, default=None,
+                        help='File with one cluster ID per line, to fetch all records of each cluster')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Concurrent requests with --cluster_ids_filepath, default is 8')
 
 
     args = parser.parse_args()
@@ -45,4 +61,6 @@ if __name__ == '__main__':
                    unified_dataset_name=args.unified_dataset_name,
                    cluster_id=args.cluster_id,
                    sort_by_spend=args.sort_by_spend,
-                   limit=args.limit)
+                   limit=args.limit,
+                   cluster_ids_filepath=args.cluster_ids_filepath,
+                   workers=args.workers)
@@ -1,6 +1,20 @@
 import argparse
 import csv
-from common.tamr_api_methods import TamrAPI
+import logging
+from common.tamr_api_methods import TamrAPI, encode_json_string, iter_blocks
+from common.csv_pieces import split_csv, iter_piece_rows, map_csv_pieces, csv_field_index, csv_header_fields, \
+    open_csv_at, CsvSplitError
+
+
+def cluster_json_lines(rows, prefix, cluster_suffix, id_index, cluster_index):
+    return (prefix + encode_json_string(row[id_index]) +
+            ', "clusterId": ' + encode_json_string(row[cluster_index] + cluster_suffix) + '}\n'
+            for row in rows if row)
+
+
+def cluster_json_piece(file_path, start, end, encoding, prefix, cluster_suffix, id_index, cluster_index):
+    rows = iter_piece_rows(file_path, start, end, encoding=encoding)
+    return ''.join(cluster_json_lines(rows, prefix, cluster_suffix, id_index, cluster_index)).encode('utf-8')
 
 
 def get_cluster_json(csv_filepath, 
@@ -9,26 +23,49 @@ def get_cluster_json(csv_filepath,
                      unique_id_column_name, 
                      tamr_cluster_id_col,
                      recipe_id, 
-                     encoding='utf-8'):
+                     encoding='utf-8',
+                     processes=None):
 
     """
     Takes a DataFrame with with record and cluster ids as well as
     names of the input dataset and unified dataset and creates
     a file of newline-separated JSON fragments to fed into the
-    Tamr dataset/clusters/{dataset}/import API
+    Tamr dataset/clusters/{dataset}/import API.
+    If processes is more than 1, the csv is parsed in pieces over that
+    many processes.
     """
     print('Writing JSON.')
-    with open(csv_filepath, 'r', encoding=encoding) as infile:
-        with open(json_filepath, 'w') as outfile:
-            csv_reader = csv.DictReader(infile)
-            for i, row in enumerate(csv_reader):
-                outrow = '"datasetName": "{0}", "recordId": "{1}", ' \
-                         '"clusterId": "{2}-recipe_{3}"'.format(unified_dataset_name,
-                                                     row[unique_id_column_name],
-                                                     row[tamr_cluster_id_col],
-                                                     recipe_id)
-                outrow = '{' + outrow + '}'
-                outfile.write(outrow + '\n')
+    # Everything but the record and cluster ids is the same on every line
+    prefix = '{"datasetName": ' + encode_json_string(unified_dataset_name) + ', "recordId": '
+    cluster_suffix = '-recipe_{}'.format(recipe_id)
+    with open(json_filepath, 'wb') as outfile:
+        offset = 0
+        if processes and processes > 1:
+            header, pieces = split_csv(csv_filepath)
+            try:
+                fieldnames = csv_header_fields(header, encoding=encoding)
+                args = (encoding, prefix, cluster_suffix,
+                        csv_field_index(fieldnames, unique_id_column_name),
+                        csv_field_index(fieldnames, tamr_cluster_id_col))
+                for block in map_csv_pieces(cluster_json_piece, csv_filepath, pieces, args=args,
+                                            processes=processes):
+                    outfile.write(block)
+                return json_filepath
+            except CsvSplitError as e:
+                # A quote inside an unquoted field misled split_csv. The pieces
+                # before e.start are written, the rest is read serially.
+                logging.warning("{0}, reading {1} serially from byte {2}".format(e, csv_filepath, e.start))
+                offset = e.start
+
+        with open_csv_at(csv_filepath, offset, encoding=encoding) as infile:
+            csv_reader = csv.reader(infile)
+            if not offset:
+                fieldnames = next(csv_reader)
+            lines = cluster_json_lines(csv_reader, prefix, cluster_suffix,
+                                       csv_field_index(fieldnames, unique_id_column_name),
+                                       csv_field_index(fieldnames, tamr_cluster_id_col))
+            for block in iter_blocks(lines):
+                outfile.write(block)
     return json_filepath
 
 
@@ -36,13 +73,13 @@ def import_clusters(host, protocol, port, username, password,
                     unified_dataset_name, cluster_name_field,
                     recipe_id, csv_filepath, json_filepath,
                     unique_id_column_name,
-                    tamr_cluster_id_col, encoding, create_json=True):
+                    tamr_cluster_id_col, encoding, create_json=True, processes=None):
 
     if create_json:
         json_filepath = get_cluster_json(csv_filepath, json_filepath,
                                          unified_dataset_name,
                                          unique_id_column_name, tamr_cluster_id_col, recipe_id,
-                                         encoding=encoding)
+                                         encoding=encoding, processes=processes)
     with TamrAPI(host, protocol, port, username, password) as api:
         response = api.import_clusters(unified_dataset_name=unified_dataset_name,
                                        cluster_name_field=cluster_name_field,
@@ -82,6 +119,8 @@ if __name__ == '__main__':
                         help='Encoding, default is utf-8')
     parser.add_argument('--create_json', type=bool, required=False, default=True,
                         help='Create JSON file with cluster membership, default is True')
+    parser.add_argument('--processes', type=int, required=False, default=None,
+                        help='Number of processes used to parse the csv, default is 1')
 
     args = parser.parse_args()
     import_clusters(host=args.host,
@@ -97,4 +136,5 @@ if __name__ == '__main__':
                     unique_id_column_name=args.unique_id_column_name,
                     tamr_cluster_id_col=args.tamr_cluster_id_col,
                     encoding=args.encoding,
-                    create_json=args.create_json)
+                    create_json=args.create_json,
+                    processes=args.processes)
@@ -13,27 +13,29 @@ def is_valid_file(filename):
         return filename
 
 
-def import_dataset(host, protocol, port, username, password, dataset_name, csv_filepath, id_field, description, create_json=True):
+def import_dataset(host, protocol, port, username, password, dataset_name, csv_filepath, id_field, description, create_json=True, streaming=False):
 
     start = datetime.datetime.now()
 
     csv_filepath = is_valid_file(csv_filepath)
 
-    # Create dataset
+    # One client for both steps
     with TamrAPI(host, protocol, port, username, password) as api:
+
+        # Create dataset
         response = api.create_dataset(dataset_name,
                                       csv_filepath,
                                       id_field,
                                       description=description)
-    print(response.json())
+        print(response.json())
 
-    # Upload records
-    with TamrAPI(host, protocol, port, username, password) as api:
+        # Upload records
         response = api.update_dataset(dataset_name=dataset_name,
-                                      file_name=csv_filepath,
+                                      file_path=csv_filepath,
                                       id_field=id_field,
-                                      create_json=create_json)
-    print(response.json())
+                                      create_json=create_json,
+                                      streaming=streaming)
+        print(response.json())
 
     end = datetime.datetime.now()
     duration = round((end - start).seconds / 60, 3)
@@ -63,6 +65,8 @@ if __name__ == '__main__':
                         help='ID Field')
     parser.add_argument('--create_json', type=bool, default=True,
                         help='false if latest JSON file already exists. Default is true')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Convert and upload the csv in one pass without writing a JSON file')
     args = parser.parse_args()
     import_dataset(host=args.host,
                    protocol=args.protocol,
@@ -73,5 +77,6 @@ if __name__ == '__main__':
                    csv_filepath=args.csv_filepath,
                    description=args.description,
                    id_field=args.id_field,
-                   create_json=args.create_json)
+                   create_json=args.create_json,
+                   streaming=args.streaming)
 
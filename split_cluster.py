@@ -4,7 +4,16 @@ from common.tamr_api_methods import TamrAPI
 
 def split_cluster(host, protocol, port, username, password,
                    unified_dataset_name, cluster_name_field, 
-                   json_file_path):
+                   json_file_path, workers=None, batch_size=1):
+
+    if workers:
+        # Bulk mode, returns a result per move instead of the last response
+        with TamrAPI(host, protocol, port, username, password, pool_size=workers) as api:
+            return api.split_clusters_bulk(unified_dataset_name=unified_dataset_name,
+                                           cluster_name_field=cluster_name_field,
+                                           json_file_path=json_file_path,
+                                           batch_size=batch_size,
+                                           workers=workers)
 
     with TamrAPI(host, protocol, port, username, password) as api:
         response = api.split_cluster(unified_dataset_name=unified_dataset_name,
@@ -32,6 +41,10 @@ if __name__ == '__main__':
                         help='Name of the column selected to represent cluster name')
     parser.add_argument('--json_file_path', type=str, required=True,
                         help='Filepath to newline-separated JSON')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Send moves over this many concurrent requests and check every response')
+    parser.add_argument('--batch_size', type=int, default=1,
+                        help='Moves per request when --workers is set, default is 1')
 
 
     args = parser.parse_args()
@@ -42,4 +55,6 @@ if __name__ == '__main__':
                    password=args.password,
                    unified_dataset_name=args.unified_dataset_name,
                    cluster_name_field=args.cluster_name_field, 
-                   json_file_path=args.json_file_path)
+                   json_file_path=args.json_file_path,
+                   workers=args.workers,
+                   batch_size=args.batch_size)
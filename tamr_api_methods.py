@@ -1,10 +1,72 @@
+import io
 import os
+import sys
 import csv
 import json
 import time
+import base64
+import codecs
+import random
+import hashlib
+import functools
+import http.client
 import tamrapi
 import logging
+import operator
+import requests
+import contextlib
+import shutil
 import subprocess
+import collections
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from json.encoder import encode_basestring_ascii
+from array import array
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from common.cluster_store import ClusterStore, CompactClusterMap, DEFAULT_RUN_SIZE
+from common.csv_pieces import csv_field_index, split_csv, map_csv_pieces, iter_piece_rows, \
+    csv_header_fields, open_csv_at, CsvSplitError, DEFAULT_PIECE_SIZE
+from common.concurrency import bounded_starmap
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON of a value as utf-8 bytes, by orjson if it is installed
+dumps_bytes = orjson.dumps if orjson is not None else lambda value: json.dumps(value).encode('utf-8')
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Approximate size in bytes of each chunk sent in a streamed request body
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# Default number of records per request for chunked uploads
+DEFAULT_CHUNK_RECORDS = 50000
+
+# Maximum size in bytes of a request body for chunked label uploads
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+
+# Size in bytes of the reads from streamed NDJSON exports
+DEFAULT_READ_SIZE = 4 * 1024 * 1024
+
+# Maximum number of rows in each file of a columnar export
+DEFAULT_ROWS_PER_FILE = 1000000
+
+# Number of jobs remembered by get_latest_job_id
+MAX_RECENT_JOBS = 10000
+
+# A slice of a newline-separated JSON stream: position of the chunk in the
+# stream, index of its first record, number of records, request body and
+# byte offset in the stream just after its last record
+Chunk = collections.namedtuple('Chunk', ['index', 'first_record', 'num_records', 'body', 'end_offset'],
+                               defaults=(None,))
 
 
 def check_status(success_code=200, silent=False):
@@ -43,16 +105,644 @@ def check_status(success_code=200, silent=False):
     return decorator
 
 
+def iter_blocks(lines, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Groups an iterable of str or bytes into utf-8 encoded blocks of
+    roughly block_size bytes, so a streamed request body is not sent as
+    one HTTP chunk per line and files are written in large blocks.
+    :param lines: Iterable of str or bytes
+    :param block_size: Approximate number of bytes per block
+    :return: Generator of bytes
+    """
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8') if isinstance(line, str) else line
+        buffer.append(data)
+        size += len(data)
+        if size >= block_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_label_lines(labels, encoding='utf-8'):
+    """
+    Newline-terminated JSON lines of labels, encoded one at a time.
+    :param labels: Iterable of dicts or JSON strings, or the path to a
+                   newline-separated JSON file or to a csv with a header,
+                   whose rows are sent as JSON objects of strings
+    :param encoding: Encoding of the file
+    :return: Generator of bytes
+    """
+    if isinstance(labels, str):
+        if labels.lower().endswith('.csv'):
+            with open(labels, 'r', newline='', encoding=encoding) as f:
+                for row in csv.DictReader(f):
+                    yield dumps_bytes(row) + b'\n'
+        else:
+            with open(labels, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        yield line if line.endswith(b'\n') else line + b'\n'
+        return
+    for label in labels:
+        if isinstance(label, str):
+            label = label.encode('utf-8')
+        elif not isinstance(label, bytes):
+            label = dumps_bytes(label)
+        yield label if label.endswith(b'\n') else label + b'\n'
+
+
+def encode_categorize_lines(dataset_id, tag, record_ids, category_ids):
+    """
+    Newline-terminated JSON lines of categorize actions, as sent to
+    /transactions/categorize. The fields shared by all records are encoded once.
+    :param dataset_id: Id of the dataset of the records
+    :param tag: Categorization recipe tag, e.g. recipe_23
+    :param record_ids: Sequence of record ids
+    :param category_ids: Sequence of category ids, in the order of record_ids
+    :return: Generator of bytes
+    """
+    prefix = b'{"datasetId":' + dumps_bytes(dataset_id) + b',"tag":' + dumps_bytes(tag) + b',"recordId":'
+    for record_id, category_id in zip(record_ids, category_ids):
+        yield prefix + dumps_bytes(record_id) + b',"categoryId":' + dumps_bytes(category_id) + b'}\n'
+
+
+def json_array_body(lines):
+    """
+    Joins newline-terminated JSON lines, e.g. a Chunk body, into a JSON array.
+    """
+    if isinstance(lines, bytes):
+        return b'[' + lines.rstrip(b'\n').replace(b'\n', b',') + b']'
+    return b'[' + b','.join(line.rstrip(b'\n') for line in lines) + b']'
+
+
+def encode_json_string(value):
+    """
+    Returns value as an escaped JSON string literal, including quotes.
+    Same output as json.dumps(value) for a str, but without its overhead.
+    """
+    return encode_basestring_ascii(value)
+
+
+class CreateLineEncoder(object):
+    """
+    Encodes csv rows into newline-terminated JSON CREATE actions for the
+    dataset update endpoint, with the same content as json.dumps of
+    {'action': 'CREATE', 'recordId': ..., 'record': <csv.DictReader row>}.
+    The JSON keys of the header columns are escaped once up front, and
+    orjson is used instead when it is installed. The json backend writes
+    exactly the bytes of json.dumps; orjson writes the same JSON without
+    spaces and with utf-8 instead of \\u escapes.
+    """
+
+    def __init__(self, fieldnames, backend=None):
+        """
+        :param fieldnames: Header of the csv
+        :param backend: 'json' or 'orjson', default is orjson if installed
+        """
+        if backend is None:
+            backend = 'json' if orjson is None else 'orjson'
+        assert backend in ('json', 'orjson'), "Unknown JSON backend {}".format(backend)
+        assert backend == 'json' or orjson is not None, "orjson is not installed"
+        self.backend = backend
+        self.fieldnames = list(fieldnames)
+        self.keys = [encode_json_string(name) + ': ' for name in self.fieldnames]
+        # With repeated column names csv.DictReader keeps the last value
+        self.unique_fields = len(set(self.fieldnames)) == len(self.fieldnames)
+
+    def record(self, values):
+        """
+        Returns the dict csv.DictReader would produce for a row.
+        :param values: List of values of a csv row
+        :return: dict
+        """
+        record = dict(zip(self.fieldnames, values))
+        if len(values) > len(self.fieldnames):
+            record[None] = values[len(self.fieldnames):]
+        elif len(values) < len(self.fieldnames):
+            for name in self.fieldnames[len(values):]:
+                record[name] = None
+        return record
+
+    def encode(self, record_id, values):
+        """
+        :param record_id: recordId of the row, str or int
+        :param values: List of values of a csv row
+        :return: bytes
+        """
+        if len(values) != len(self.fieldnames) or not self.unique_fields:
+            entry = {'action': 'CREATE', 'recordId': record_id, 'record': self.record(values)}
+            return (json.dumps(entry) + '\n').encode('utf-8')
+
+        if self.backend == 'orjson':
+            entry = {'action': 'CREATE', 'recordId': record_id, 'record': dict(zip(self.fieldnames, values))}
+            return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE)
+
+        if isinstance(record_id, str):
+            record_id = encode_json_string(record_id)
+        else:
+            record_id = json.dumps(record_id)
+        fields = ', '.join([key + encode_json_string(value) for key, value in zip(self.keys, values)])
+        return ('{"action": "CREATE", "recordId": ' + record_id +
+                ', "record": {' + fields + '}}\n').encode('ascii')
+
+
+def encode_create_rows(rows, encoder, id_index=None, first_record=0):
+    """
+    Generator of JSON CREATE lines for csv rows. Blank rows are skipped,
+    as csv.DictReader does.
+    :param rows: Iterable of lists of values, e.g. a csv.reader
+    :param encoder: CreateLineEncoder for the header of the csv
+    :param id_index: Position of the id field, None to number records instead
+    :param first_record: Number of records before rows, used for numbering
+    :return: Generator of bytes
+    """
+    index = first_record
+    for values in rows:
+        if not values:
+            continue
+        index += 1
+        if id_index is None:
+            record_id = index
+        else:
+            record_id = values[id_index] if id_index < len(values) else None
+        yield encoder.encode(record_id, values)
+
+
+def count_csv_piece_records(file_path, start, end, encoding, delimiter):
+    rows = iter_piece_rows(file_path, start, end, encoding=encoding, delimiter=delimiter)
+    return sum(1 for values in rows if values)
+
+
+def encode_csv_piece(file_path, start, end, first_record, encoding, delimiter, fieldnames, id_field, backend):
+    encoder = CreateLineEncoder(fieldnames, backend=backend)
+    id_index = csv_field_index(fieldnames, id_field) if id_field else None
+    rows = iter_piece_rows(file_path, start, end, encoding=encoding, delimiter=delimiter)
+    return b''.join(encode_create_rows(rows, encoder, id_index=id_index, first_record=first_record))
+
+
+def encode_csv_tail(file_path, offset, first_record, encoding, delimiter, fieldnames, id_field, backend):
+    """
+    Serial counterpart of encode_csv_piece for the rest of a csv from a
+    byte offset, for when split_csv could not find its record boundaries.
+    :param fieldnames: Header of the csv, None if the rows start with it
+    :return: Generator of bytes
+    """
+    with open_csv_at(file_path, offset, encoding=encoding) as infile:
+        rows = csv.reader(infile, delimiter=delimiter)
+        if fieldnames is None:
+            fieldnames = next(rows, None)
+            if fieldnames is None:
+                return
+        encoder = CreateLineEncoder(fieldnames, backend=backend)
+        id_index = csv_field_index(fieldnames, id_field) if id_field else None
+        yield from iter_blocks(encode_create_rows(rows, encoder, id_index=id_index, first_record=first_record))
+
+
+def iter_chunks(lines, max_records=DEFAULT_CHUNK_RECORDS, max_bytes=None, start_record=0, start_offset=None):
+    """
+    Splits an iterable of newline-separated JSON lines into Chunks bounded
+    by record count and/or size in bytes. Blank lines are skipped.
+    :param lines: Iterable of str or bytes, e.g. from get_data or json_create_lines
+    :param max_records: Maximum number of records per chunk, None for no limit
+    :param max_bytes: Maximum size of a chunk body in bytes, None for no limit.
+                      A single record larger than max_bytes gets its own chunk.
+    :param start_record: Number of records to skip, e.g. when resuming an upload.
+                         If start_offset is given, the lines already start after
+                         them and start_record only numbers the records.
+    :param start_offset: Byte offset in the source of the first line, e.g. from get_data(offset=...)
+    :return: Generator of Chunk
+    """
+    assert max_records or max_bytes, "Must set max_records or max_bytes"
+    buffer = []
+    size = 0
+    index = 0
+    first_record = start_record
+    skipped = 0 if start_offset is None else start_record
+    offset = start_offset or 0
+    end_offset = offset
+    for line in lines:
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        offset += len(line)
+        if not line.strip():
+            continue
+        if skipped < start_record:
+            skipped += 1
+            continue
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        if buffer and ((max_records and len(buffer) >= max_records) or
+                       (max_bytes and size + len(line) > max_bytes)):
+            yield Chunk(index, first_record, len(buffer), b''.join(buffer), end_offset)
+            index += 1
+            first_record += len(buffer)
+            buffer = []
+            size = 0
+        buffer.append(line)
+        size += len(line)
+        end_offset = offset
+    if buffer:
+        yield Chunk(index, first_record, len(buffer), b''.join(buffer), end_offset)
+
+
+def iter_pages(fetch_page, page_size, prefetch=4, start=0, total=None, ordered=True):
+    """
+    Walks an offset/limit paginated listing, fetching up to prefetch pages
+    concurrently ahead of the page being consumed. The listing ends at
+    total if it is known, otherwise at the first page shorter than page_size.
+    :param fetch_page: Function of (offset, limit) returning a list of items
+    :param page_size: Number of items per page
+    :param prefetch: Number of pages requested at a time
+    :param start: Offset of the first page
+    :param total: Number of items in the listing, if known
+    :param ordered: Yield pages in listing order. If False, they are
+                    yielded as soon as they are fetched.
+    :return: Generator of lists of items
+    """
+    offset = start
+    ended = False
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = collections.deque()
+        try:
+            while True:
+                while not ended and len(pending) < prefetch and (total is None or offset < total):
+                    pending.append(executor.submit(fetch_page, offset, page_size))
+                    offset += page_size
+                if not pending:
+                    return
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                    pending = collections.deque(not_done)
+                for future in done:
+                    page = future.result()
+                    if len(page) < page_size:
+                        ended = True
+                    if page:
+                        yield page
+                # Pages still pending in order are past the end
+                if ended and ordered:
+                    return
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def write_columnar(csv_file, out_dir, file_format='parquet', column_types=None,
+                   rows_per_file=DEFAULT_ROWS_PER_FILE, block_size=DEFAULT_PIECE_SIZE):
+    """
+    Converts a csv, such as a dataset export, to typed Parquet or Arrow IPC
+    files a block at a time, so the csv is never loaded whole. Columns are
+    strings unless given in column_types, since a type inferred from the
+    first block can fail on a later one.
+    Files are written as part-00000.parquet, part-00001.parquet, ... to a
+    temporary directory that replaces out_dir when done. Requires pyarrow.
+    :param csv_file: Path to csv or a binary file object, e.g. a streamed response
+    :param out_dir: Directory to write the files to
+    :param file_format: 'parquet' or 'arrow'
+    :param column_types: dict of column name -> pyarrow type, e.g. {'price': pyarrow.float64()}
+    :param rows_per_file: Maximum number of rows per file
+    :param block_size: Size in bytes of the csv blocks converted at a time
+    :return: dict with rows, files and seconds
+    """
+    if pyarrow is None:
+        raise ImportError("pyarrow is required for columnar exports")
+    assert file_format in ('parquet', 'arrow'), "file_format must be 'parquet' or 'arrow'"
+    started = time.time()
+    tmp_dir = out_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    close_file = isinstance(csv_file, str)
+    if close_file:
+        csv_file = open(csv_file, 'rb')
+    elif not hasattr(csv_file, 'peek'):
+        csv_file = io.BufferedReader(csv_file)
+    writer = None
+    files = 0
+    rows = 0
+    file_rows = 0
+    try:
+        # The header is read here, so every column can be typed before pyarrow sees any rows
+        header = csv_file.readline()
+        while header.count(b'"') % 2:
+            line = csv_file.readline()
+            if not line:
+                break
+            header += line
+        column_names = next(csv.reader(io.StringIO(header.decode('utf-8-sig'), newline='')), [])
+        types = {column: pyarrow.string() for column in column_names}
+        types.update(column_types or {})
+        # pyarrow rejects an empty stream, which is what a header-only csv leaves
+        batches = ()
+        if csv_file.peek(1):
+            batches = pyarrow.csv.open_csv(csv_file,
+                                           read_options=pyarrow.csv.ReadOptions(block_size=block_size,
+                                                                                column_names=column_names),
+                                           convert_options=pyarrow.csv.ConvertOptions(column_types=types,
+                                                                                      strings_can_be_null=True))
+        for batch in batches:
+            if writer is not None and file_rows >= rows_per_file:
+                writer.close()
+                writer = None
+            if writer is None:
+                path = os.path.join(tmp_dir, 'part-{0:05d}.{1}'.format(files, file_format))
+                if file_format == 'parquet':
+                    writer = pyarrow.parquet.ParquetWriter(path, batch.schema)
+                else:
+                    writer = pyarrow.ipc.new_file(path, batch.schema)
+                files += 1
+                file_rows = 0
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            file_rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+        if close_file:
+            csv_file.close()
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return {'rows': rows, 'files': files, 'seconds': round(time.time() - started, 3)}
+
+
+def page_items(body):
+    """
+    Reads a page of a paginated listing, which is either a list of items
+    or a dict with items and, optionally, the total number of items.
+    :return: (list of items, total or None)
+    """
+    if isinstance(body, list):
+        return body, None
+    return body.get('items', []), body.get('total')
+
+
+def file_fingerprint(file_path, sample_size=1024 * 1024, full=False):
+    """
+    Returns a sha1 hex digest identifying the content of a file. By default
+    it is computed from its size, modification time and its first and last
+    sample_size bytes, so that large files do not have to be read in full.
+    :param file_path: Path to file
+    :param sample_size: Number of bytes read from each end of the file
+    :param full: Hash the whole file instead of samples
+    :return: str
+    """
+    stat = os.stat(file_path)
+    digest = hashlib.sha1('{0}:{1}'.format(stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    with open(file_path, 'rb') as f:
+        if full:
+            for block in iter(lambda: f.read(sample_size), b''):
+                digest.update(block)
+            return digest.hexdigest()
+        digest.update(f.read(sample_size))
+        if stat.st_size > sample_size:
+            f.seek(max(sample_size, stat.st_size - sample_size))
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def record_digest(values):
+    """
+    Returns an 8 byte digest of the content of a record, used to detect
+    records that changed between two loads.
+    :param values: List of values of a csv row, in header order
+    :return: bytes
+    """
+    return hashlib.blake2b(json.dumps(values).encode('utf-8'), digest_size=8).digest()
+
+
+def record_id_hash(record_id):
+    """
+    Returns a non-zero 64 bit hash of a record id, for DeltaIndex. The
+    table is rebuilt from the index file in every process, so the
+    per-process randomized str hash can be used.
+    """
+    return (hash(record_id) & 0xFFFFFFFFFFFFFFFF) or 1
+
+
+class DeltaIndex(object):
+    """
+    Record id -> record_digest of a previous load, read from an index file
+    written by TamrAPI.json_delta_lines (a csv of record id and hex digest).
+
+    Ids are kept as 64 bit hashes in an open-addressing table of fixed
+    width arrays, about 24 bytes per record instead of a dict entry with
+    two str and a bytes object. The ids themselves are read again from
+    the index file when listing the records that were not seen.
+    """
+
+    # Maximum fraction of used slots
+    LOAD_FACTOR = 0.7
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        records = 0
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                for block in iter(lambda: f.read(DEFAULT_BLOCK_SIZE), b''):
+                    records += block.count(b'\n')
+        self.capacity = max(8, int(records / self.LOAD_FACTOR) + 1)
+        self.keys = array('Q', bytes(8 * self.capacity))
+        self.digests = array('Q', bytes(8 * self.capacity))
+        # 1 for slots whose record was popped
+        self.seen = bytearray(self.capacity)
+        for record_id, digest in self.read():
+            key = record_id_hash(record_id)
+            slot = self.find_slot(key)
+            self.keys[slot] = key
+            self.digests[slot] = int(digest, 16)
+
+    def read(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'r', encoding='utf-8', newline='') as f:
+            for record_id, digest in csv.reader(f):
+                yield record_id, digest
+
+    def find_slot(self, key):
+        """
+        Returns the slot of key in the table, or of the empty slot where it would go.
+        """
+        keys = self.keys
+        slot = key % self.capacity
+        while keys[slot] and keys[slot] != key:
+            slot = (slot + 1) % self.capacity
+        return slot
+
+    def pop(self, record_id):
+        """
+        Returns the digest of record_id and marks it as seen, or None if it
+        is not in the index or was already popped.
+        :return: bytes or None
+        """
+        slot = self.find_slot(record_id_hash(record_id))
+        if not self.keys[slot] or self.seen[slot]:
+            return None
+        self.seen[slot] = 1
+        return self.digests[slot].to_bytes(8, 'big')
+
+    def unseen(self):
+        """
+        Generator of the ids in the index that were not popped.
+        """
+        for record_id, _ in self.read():
+            slot = self.find_slot(record_id_hash(record_id))
+            if not self.seen[slot]:
+                # Mark it, so a repeated id is only listed once
+                self.seen[slot] = 1
+                yield record_id
+
+
+class UploadJournal(object):
+    """
+    Local checkpoint file recording how many records of a source file
+    have been acknowledged by the server, and the byte offset just after
+    them in the uploaded JSON file, so that an interrupted upload can resume
+    where it stopped. Entries are keyed by dataset name and source file
+    fingerprint, so a changed file starts from zero.
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.entries = {}
+        if os.path.exists(journal_path):
+            with open(journal_path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(dataset_name, source_hash):
+        return '{0}:{1}'.format(dataset_name, source_hash)
+
+    def committed_records(self, dataset_name, source_hash):
+        entry = self.entries.get(self.key(dataset_name, source_hash))
+        if entry is None:
+            return 0
+        return entry['records']
+
+    def committed_offset(self, dataset_name, source_hash):
+        entry = self.entries.get(self.key(dataset_name, source_hash))
+        if entry is None:
+            return None
+        return entry.get('offset')
+
+    def commit(self, dataset_name, source_hash, records, offset=None):
+        self.entries[self.key(dataset_name, source_hash)] = {'records': records,
+                                                             'offset': offset,
+                                                             'updated': time.time()}
+        self.save()
+
+    def clear(self, dataset_name, source_hash):
+        if self.entries.pop(self.key(dataset_name, source_hash), None) is not None:
+            self.save()
+
+    def save(self):
+        # Write to a temporary file first so a crash never leaves a partial journal
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.journal_path)
+
+
+class PooledClient(object):
+    """
+    HTTP client with the same get/post/put/delete(endpoint, ...) interface
+    as tamrapi.Client, backed by a requests.Session that keeps a pool of
+    keep-alive connections. Idempotent requests are retried on connection
+    errors and 502/503/504 responses. It is safe to share between threads
+    as long as pool_size is at least the number of threads.
+    """
+
+    def __init__(self, protocol, host, port, api_url, credentials,
+                 pool_size=10, max_retries=3, backoff_factor=0.5, timeout=None):
+        """
+        :param protocol: http or https
+        :param host: Unify host
+        :param port: Unify port
+        :param api_url: Path prefix of all endpoints, e.g. /api
+        :param credentials: Tuple of username and password
+        :param pool_size: Maximum number of connections kept open
+        :param max_retries: Number of retries of idempotent requests
+        :param backoff_factor: Backoff between retries, see urllib3 Retry
+        :param timeout: Default timeout in seconds, or (connect, read) tuple. None waits forever.
+        """
+        self.base_url = '{0}://{1}:{2}{3}'.format(protocol, host, port, api_url)
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=Retry(total=max_retries,
+                                                backoff_factor=backoff_factor,
+                                                status_forcelist=(502, 503, 504),
+                                                raise_on_status=False))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        token = base64.b64encode('{0}:{1}'.format(*credentials).encode('utf-8')).decode('ascii')
+        self.session.headers['Authorization'] = 'BasicCreds {}'.format(token)
+
+    def request(self, method, endpoint, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, self.base_url + endpoint, **kwargs)
+
+    def get(self, endpoint, **kwargs):
+        return self.request('GET', endpoint, **kwargs)
+
+    def post(self, endpoint, **kwargs):
+        return self.request('POST', endpoint, **kwargs)
+
+    def put(self, endpoint, **kwargs):
+        return self.request('PUT', endpoint, **kwargs)
+
+    def delete(self, endpoint, **kwargs):
+        return self.request('DELETE', endpoint, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class TamrAPI(object):
     def __init__(self,
                  host, protocol, port,
-                 user, pw):
+                 user, pw,
+                 pool_size=None, max_retries=3, timeout=None, client=None,
+                 metadata_ttl=300):
+        """
+        :param pool_size: If set, use a PooledClient with this many keep-alive connections
+                          instead of tamrapi.Client
+        :param max_retries: Number of retries of idempotent requests, for PooledClient
+        :param timeout: Default request timeout, for PooledClient
+        :param client: Client to share with other TamrAPI objects, e.g. a PooledClient.
+                       It is used as is and not closed on exit.
+        :param metadata_ttl: Seconds that name to id lookups of datasets, projects, recipes
+                             and taxonomies are cached for. 0 disables the cache.
+        """
         self.host = host
         self.port = port
         self.user = user
         self.pw = pw
         self.api_url = '/api'
         self.protocol = protocol
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.shared_client = client
+        self.metadata_ttl = metadata_ttl
+        # Listing name -> (time fetched, index built from the listing)
+        self.metadata_cache = {}
+        # (job id, description) of the newest jobs seen, newest first, see get_latest_job_id
+        self.recent_jobs = []
 
         if self.protocol.lower() == 'https':
             assert self.cert is not None, "Must set valid certificate for HTTPS"
@@ -60,17 +750,64 @@ class TamrAPI(object):
 
         self.headers = {}
 
+    def create_client(self):
+        """
+        Returns a new client for this host, pooled if pool_size is set.
+        """
+        if self.pool_size:
+            return PooledClient(protocol=self.protocol,
+                                host=self.host,
+                                port=self.port,
+                                api_url=self.api_url,
+                                credentials=(self.user, self.pw),
+                                pool_size=self.pool_size,
+                                max_retries=self.max_retries,
+                                timeout=self.timeout)
+        return tamrapi.Client(protocol=self.protocol,
+                              host=self.host,
+                              port=self.port,
+                              api_url=self.api_url,
+                              credentials=(self.user,self.pw))
+
     def __enter__(self):
-        self.client = tamrapi.Client(protocol=self.protocol,
-                                     host=self.host,
-                                     port=self.port,
-                                     api_url=self.api_url,
-                                     credentials=(self.user,self.pw))
+        if self.shared_client is not None:
+            self.client = self.shared_client
+        else:
+            self.client = self.create_client()
         return self
 
     def __exit__(self, *args):
+        if self.client is not self.shared_client and hasattr(self.client, 'close'):
+            self.client.close()
         self.client = None
 
+    def lookup_metadata(self, listing, build_index, key):
+        """
+        Looks up key in an index built from one of the metadata listings
+        (datasets, projects, recipes, taxonomies). The index is rebuilt when
+        it is older than metadata_ttl or when key is not in it, so objects
+        created by someone else are still found.
+        :param listing: Name of the listing, used as cache key
+        :param build_index: Function that downloads the listing and returns a dict
+        :param key: Key to look up
+        :return: Value for key, or None if it is not in the listing
+        """
+        fetched, index = self.metadata_cache.get(listing, (None, None))
+        if index is not None and time.time() - fetched < self.metadata_ttl and key in index:
+            return index[key]
+        index = build_index()
+        self.metadata_cache[listing] = (time.time(), index)
+        return index.get(key)
+
+    def invalidate_metadata(self, *listings):
+        """
+        Drops cached metadata listings, or all of them if none are given.
+        """
+        if not listings:
+            self.metadata_cache.clear()
+        for listing in listings:
+            self.metadata_cache.pop(listing, None)
+
     @check_status(success_code=200)
     def health(self):
         return self.client.get('/service/health')
@@ -94,6 +831,8 @@ class TamrAPI(object):
 
     @check_status(success_code=201, silent=True)
     def create_project(self, project_name, project_type):
+        # Creating a project also creates recipes and datasets
+        self.invalidate_metadata()
         return self.client.post('/recipe/projects/new/{0}'.format(project_type),
                                 params={"name": project_name})
 
@@ -181,34 +920,169 @@ class TamrAPI(object):
                                           'generatePrimaryKey': generate_primary_key,
                                           'description': description})
         f.close()
+        self.invalidate_metadata('datasets')
         return response
 
-    def get_data(self, file_path):
+    def get_data(self, file_path, offset=0):
         with open(file_path, 'rb') as f:
+            f.seek(offset)
             for index, row in enumerate(f):
                 if index % 100000 == 0:
                     print(index)
                 yield row
 
-    def write_json_create_file(self, in_filepath, id_field, out_filepath, encoding='utf-8', delimiter=','):
+    def json_create_lines(self, in_filepath, id_field, encoding='utf-8', delimiter=',', backend=None,
+                          processes=None):
+        """
+        Generator that converts the rows of a csv into newline-terminated
+        JSON CREATE actions for the dataset update endpoint. Only one row
+        is held in memory at a time.
+        :param in_filepath: Path to csv
+        :param id_field: Column to use as recordId. If empty, the 1-based row number is used
+        :param encoding: Encoding of the csv, default is utf-8
+        :param delimiter: Delimiter of the csv, default is ','
+        :param backend: JSON backend, see CreateLineEncoder
+        :param processes: If more than 1, parse the csv in pieces over this many processes
+                          (see: parallel_json_create_lines)
+        :return: Generator of bytes
+        """
+        if processes and processes > 1:
+            for lines in self.parallel_json_create_lines(in_filepath, id_field, encoding=encoding,
+                                                         delimiter=delimiter, backend=backend,
+                                                         processes=processes):
+                for line in lines.splitlines(keepends=True):
+                    yield line
+            return
+
+        with open(in_filepath, 'r', encoding=encoding, newline='') as infile:
+            csv_reader = csv.reader(infile, delimiter=delimiter)
+            fieldnames = next(csv_reader, None)
+            if fieldnames is None:
+                return
+            encoder = CreateLineEncoder(fieldnames, backend=backend)
+            id_index = csv_field_index(fieldnames, id_field) if id_field else None
+            for index, line in enumerate(encode_create_rows(csv_reader, encoder, id_index=id_index)):
+                if index % 100000 == 0:
+                    print(index)
+                yield line
+
+    def parallel_json_create_lines(self, in_filepath, id_field, encoding='utf-8', delimiter=',', backend=None,
+                                   processes=None, piece_size=DEFAULT_PIECE_SIZE, ordered=True):
+        """
+        Same as json_create_lines, but splits the csv at record boundaries
+        (see: split_csv) and parses and encodes the pieces over a process
+        pool. Without an id_field, records are numbered, which needs an
+        extra parallel pass to count the records of each piece. If a quote
+        inside an unquoted field misleads split_csv, the csv is parsed
+        serially from the first piece that does not end on a record boundary.
+        :param in_filepath: Path to csv
+        :param id_field: Column to use as recordId. If empty, the 1-based row number is used
+        :param encoding: Encoding of the csv, must be ASCII-compatible
+        :param delimiter: Delimiter of the csv, default is ','
+        :param backend: JSON backend, see CreateLineEncoder
+        :param processes: Number of processes, default is the number of cpus
+        :param piece_size: Approximate size in bytes of each piece
+        :param ordered: Yield pieces in file order. Only allowed to be False with an id_field.
+        :return: Generator of bytes, each holding the CREATE lines of one piece
+        """
+        assert ordered or id_field, "Records can only be numbered in order"
+        header, pieces = split_csv(in_filepath, piece_size=piece_size)
+        fieldnames = None
+        first_records = {}
+        encoding_pieces = False
+        try:
+            fieldnames = csv_header_fields(header, encoding=encoding, delimiter=delimiter)
+            if fieldnames is None:
+                return
+            print('Parsing {0} pieces over {1} processes'.format(len(pieces), processes or os.cpu_count()))
+
+            first_record = 0
+            if not id_field or not ordered:
+                # This pass also finds a wrong boundary before anything is yielded,
+                # since pieces yielded out of order could not be taken back
+                counts = map_csv_pieces(count_csv_piece_records, in_filepath, pieces,
+                                        args=(encoding, delimiter), processes=processes)
+                for (start, end), count in zip(pieces, counts):
+                    first_records[start] = first_record
+                    first_record += count
+            pieces = [(start, end, first_records.get(start, 0)) for start, end in pieces]
+            results = map_csv_pieces(encode_csv_piece, in_filepath, pieces,
+                                     args=(encoding, delimiter, fieldnames, id_field, backend),
+                                     processes=processes, ordered=ordered)
+            encoding_pieces = True
+            for index, lines in enumerate(results):
+                print('Parsed piece {0} of {1}'.format(index + 1, len(pieces)))
+                yield lines
+            return
+        except CsvSplitError as e:
+            # A quote inside an unquoted field misled split_csv. Pieces can only
+            # fail while encoding if they are yielded in order, so those before
+            # e.start are complete; otherwise nothing has been yielded yet.
+            offset = e.start if encoding_pieces else 0
+            logging.warning("{0}, parsing {1} serially from byte {2}".format(e, in_filepath, offset))
+        yield from encode_csv_tail(in_filepath, offset, first_records.get(offset, 0), encoding, delimiter,
+                                   fieldnames if offset else None, id_field, backend)
+
+    def json_delta_lines(self, in_filepath, id_field, index_path, encoding='utf-8', delimiter=','):
+        """
+        Generator of JSON update actions for only the rows of a csv that
+        changed since the load recorded in index_path: CREATE for new or
+        changed records and DELETE for records no longer in the csv.
+        The index of this load is written to <index_path>.new, which should
+        replace index_path once the upload has succeeded.
+        :param in_filepath: Path to csv
+        :param id_field: Column to use as recordId
+        :param index_path: Path to index of the previous load
+        :param encoding: Encoding of the csv, default is utf-8
+        :param delimiter: Delimiter of the csv, default is ','
+        :return: Generator of str or bytes
+        """
+        assert id_field, "Delta updates require an id_field"
+        previous = DeltaIndex(index_path)
+        changed = 0
+        deleted = 0
+        with open(in_filepath, 'r', encoding=encoding, newline='') as infile:
+            with open(index_path + '.new', 'w', encoding='utf-8', newline='') as index_file:
+                index_writer = csv.writer(index_file)
+                csv_reader = csv.reader(infile, delimiter=delimiter)
+                fieldnames = next(csv_reader, None)
+                if fieldnames is not None:
+                    encoder = CreateLineEncoder(fieldnames)
+                    id_index = csv_field_index(fieldnames, id_field)
+                    index = 0
+                    for values in csv_reader:
+                        # Blank rows are skipped, as csv.DictReader does
+                        if not values:
+                            continue
+                        if index % 100000 == 0:
+                            print(index)
+                        index += 1
+                        record_id = values[id_index] if id_index < len(values) else ''
+                        digest = record_digest(values)
+                        index_writer.writerow([record_id, digest.hex()])
+                        if previous.pop(record_id) == digest:
+                            continue
+                        changed += 1
+                        yield encoder.encode(record_id, values)
+        # Whatever was not seen in the previous index is not in this csv
+        for record_id in previous.unseen():
+            deleted += 1
+            yield json.dumps({'action': 'DELETE',
+                              'recordId': record_id}) + '\n'
+        print('Found {0} new or changed records and {1} deleted records'.format(changed, deleted))
+
+    def write_json_create_file(self, in_filepath, id_field, out_filepath, encoding='utf-8', delimiter=',',
+                               processes=None):
         print('Writing JSON CREATE File.')
-        with open(in_filepath, 'r', encoding=encoding) as infile:
-            with open(out_filepath, 'w') as outfile:
-                csv_reader = csv.DictReader(infile, delimiter=delimiter)
-                if id_field:
-                    for row in csv_reader:
-                        entry = {'action': 'CREATE',
-                                 'recordId': row[id_field],
-                                 'record': row}
-                        outfile.write(json.dumps(entry))
-                        outfile.write('\n')
-                else:
-                    for index, row in enumerate(csv_reader):
-                        entry = {'action': 'CREATE',
-                                 'recordId': index+1,
-                                 'record': row}
-                        outfile.write(json.dumps(entry))
-                        outfile.write('\n')
+        with open(out_filepath, 'wb') as outfile:
+            if processes and processes > 1:
+                blocks = self.parallel_json_create_lines(in_filepath, id_field, encoding=encoding,
+                                                         delimiter=delimiter, processes=processes)
+            else:
+                blocks = iter_blocks(self.json_create_lines(in_filepath, id_field,
+                                                            encoding=encoding, delimiter=delimiter))
+            for block in blocks:
+                outfile.write(block)
 
     def upload_records(self, dataset_name, json_file_path, encoding='utf-8'):
 
@@ -218,8 +1092,254 @@ class TamrAPI(object):
                                     data=self.get_data(json_file_path), stream=True)
         return response
 
+    def stream_records(self, dataset_name, file_path, id_field, delimiter=',', encoding='utf-8',
+                       block_size=DEFAULT_BLOCK_SIZE, processes=None):
+        """
+        Uploads the rows of a csv to the update endpoint without writing
+        an intermediate JSON file. Rows are converted as the request body
+        is sent, so memory use is bounded by block_size.
+        :param dataset_name: Name of dataset
+        :param file_path: Path to csv
+        :param id_field: Column to use as recordId
+        :param delimiter: Delimiter of the csv, default is ','
+        :param encoding: Encoding of the csv, default is utf-8
+        :param block_size: Approximate number of bytes sent per chunk of the request body
+        :param processes: Number of processes used to parse the csv
+        :return: requests.Response object
+        """
+        print('Streaming Records')
+        lines = self.json_create_lines(file_path, id_field, encoding=encoding, delimiter=delimiter,
+                                       processes=processes)
+        response = self.client.post(endpoint='/dataset/datasets/{0}/update'.format(dataset_name),
+                                    headers={'Content-Type': 'application/json'},
+                                    data=iter_blocks(lines, block_size=block_size), stream=True)
+        return response
+
+    def post_update_chunk(self, dataset_name, body):
+        return self.client.post(endpoint='/dataset/datasets/{0}/update'.format(dataset_name),
+                                headers={'Content-Type': 'application/json'},
+                                data=body)
+
+    def upload_chunk(self, dataset_name, chunk, max_retries=5, backoff_seconds=2, post=None, success_code=200):
+        """
+        Posts a single Chunk to the update endpoint, retrying with exponential
+        backoff on connection errors, 429 and 5xx status codes. Other 4xx
+        status codes mean the chunk itself was rejected, so it is not retried.
+        Only the position of the chunk is logged, not its body.
+        :param dataset_name: Name of dataset
+        :param chunk: Chunk, as from iter_chunks
+        :param max_retries: Number of attempts before giving up
+        :param backoff_seconds: Wait before the first retry, doubled on each retry
+        :param post: Function of (dataset_name, body) sending the chunk and returning
+                     the requests.Response, default is post_update_chunk
+        :param success_code: Status code of a successful response
+        :return: requests.Response object
+        """
+        post = post or self.post_update_chunk
+        records = "chunk {0} (records {1}-{2})".format(chunk.index, chunk.first_record,
+                                                       chunk.first_record + chunk.num_records - 1)
+        error = None
+        for attempt in range(max_retries):
+            try:
+                response = post(dataset_name, chunk.body)
+            except IOError as e:
+                error = e
+            else:
+                if response.status_code == success_code:
+                    return response
+                error = "Status code {0} != {1}: {2}".format(response.status_code, success_code, response.text)
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    logging.error("Error uploading {0}: {1}".format(records, error))
+                    raise Exception("Uploading chunk {0} was rejected: {1}".format(chunk.index, error))
+            logging.warning("Error uploading {0}: {1}".format(records, error))
+            if attempt + 1 < max_retries:
+                logging.warning("Retrying.... Attempt {} out of {}".format(attempt + 2, max_retries))
+                time.sleep(backoff_seconds * 2 ** attempt)
+
+        raise Exception("Uploading chunk {0} failed after {1} tries: {2}".format(chunk.index, max_retries, error))
+
+    def upload_chunks(self, dataset_name, lines,
+                      chunk_records=DEFAULT_CHUNK_RECORDS, chunk_bytes=None,
+                      workers=4, max_retries=5, backoff_seconds=2,
+                      start_record=0, start_offset=None, on_commit=None, post=None, success_code=200,
+                      continue_on_error=False):
+        """
+        Uploads newline-separated JSON update actions in chunks over a pool of
+        concurrent requests. Each chunk is retried on its own, so a dropped
+        connection only resends that chunk. At most 2 * workers chunks are
+        held in memory at a time.
+        :param dataset_name: Name of dataset
+        :param lines: Iterable of JSON lines, e.g. from get_data or json_create_lines
+        :param chunk_records: Maximum number of records per request
+        :param chunk_bytes: Maximum size of a request body in bytes
+        :param workers: Number of concurrent requests
+        :param max_retries: Number of attempts per chunk before giving up
+        :param backoff_seconds: Wait before the first retry of a chunk, doubled on each retry
+        :param start_record: Number of records to skip, e.g. when resuming an upload
+        :param start_offset: Byte offset of lines in their file, if they were read from
+                             it after start_record records, see iter_chunks
+        :param on_commit: Called with the number of records from the start of the stream
+                          that have all been acknowledged, and the byte offset just after
+                          them, each time that number grows
+        :param post: Function of (dataset_name, body) sending a chunk, default is post_update_chunk
+        :param success_code: Status code of a successful response
+        :param continue_on_error: Carry on past chunks that still fail after their
+                                  retries and report them, instead of raising
+        :return: dict with chunks, records and bytes acknowledged, throughput,
+                 failed record count and failures, a list with first_record,
+                 num_records and error of each failed chunk
+        """
+        print('Uploading Records in Chunks')
+        started = time.time()
+        report = {'chunks': 0, 'records': 0, 'bytes': 0, 'failed': 0, 'failures': []}
+        # Chunks can finish out of order, so only the contiguous prefix is committed
+        finished = {}
+        progress = {'next_index': 0, 'committed': start_record, 'offset': start_offset}
+
+        def send(chunk):
+            try:
+                self.upload_chunk(dataset_name, chunk, max_retries=max_retries, backoff_seconds=backoff_seconds,
+                                  post=post, success_code=success_code)
+            except Exception as e:
+                return chunk, e
+            return chunk, None
+
+        def tally(chunk, error):
+            if error is not None:
+                if not continue_on_error:
+                    raise error
+                report['failed'] += chunk.num_records
+                report['failures'].append({'first_record': chunk.first_record,
+                                           'num_records': chunk.num_records,
+                                           'error': str(error)})
+                return
+            report['chunks'] += 1
+            report['records'] += chunk.num_records
+            report['bytes'] += len(chunk.body)
+            finished[chunk.index] = chunk
+            committed = progress['committed']
+            while progress['next_index'] in finished:
+                chunk = finished.pop(progress['next_index'])
+                progress['committed'] += chunk.num_records
+                progress['offset'] = chunk.end_offset
+                progress['next_index'] += 1
+            if on_commit is not None and progress['committed'] > committed:
+                on_commit(progress['committed'], progress['offset'])
+            elapsed = time.time() - started
+            logging.info("Uploaded {0} records in {1} chunks, {2:.0f} records/s".format(
+                report['records'], report['chunks'], report['records'] / elapsed if elapsed else 0))
+
+        chunks = iter_chunks(lines, max_records=chunk_records, max_bytes=chunk_bytes,
+                             start_record=start_record, start_offset=start_offset)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            with contextlib.closing(bounded_starmap(executor, send, ((chunk,) for chunk in chunks),
+                                                    2 * workers, ordered=False)) as results:
+                for chunk, error in results:
+                    tally(chunk, error)
+
+        report['seconds'] = round(time.time() - started, 3)
+        report['records_per_second'] = round(report['records'] / report['seconds'], 1) if report['seconds'] else None
+        report['bytes_per_second'] = round(report['bytes'] / report['seconds'], 1) if report['seconds'] else None
+        print('Uploaded {records} records in {chunks} chunks in {seconds} seconds '
+              '({records_per_second} records/s), {failed} records failed'.format(**report))
+        return report
+
+    def update_dataset_chunked(self, dataset_name, file_path, id_field, delimiter=',', encoding='utf-8',
+                               create_json=True, streaming=False, chunk_records=DEFAULT_CHUNK_RECORDS,
+                               chunk_bytes=None, workers=4, max_retries=5, journal_path=None,
+                               processes=None):
+        """
+        Same as update_dataset, but uploads the records in chunks over
+        concurrent requests with per-chunk retry (see: upload_chunks).
+        If journal_path is set, acknowledged progress is checkpointed there
+        and a rerun for the same dataset and file resumes from it, by seeking
+        to the committed offset in <file_path>.json.
+        :param dataset_name:
+        :param file_path:
+        :param id_field:
+        :param delimiter:
+        :param encoding:
+        :param create_json: Write <file_path>.json before uploading. Ignored if streaming
+        :param streaming: Convert rows as they are uploaded instead of reading a JSON file.
+                          Ignored if journal_path is set
+        :param chunk_records:
+        :param chunk_bytes:
+        :param workers:
+        :param max_retries:
+        :param journal_path: Path of checkpoint journal, None to disable resuming
+        :param processes: Number of processes used to parse the csv
+        :return: dict with totals and throughput of the upload
+        """
+        print('Updating Dataset')
+        journal = None
+        start_record = 0
+        start_offset = None
+        on_commit = None
+        if journal_path:
+            journal = UploadJournal(journal_path)
+            source_hash = file_fingerprint(file_path)
+            start_record = journal.committed_records(dataset_name, source_hash)
+            start_offset = journal.committed_offset(dataset_name, source_hash)
+            if start_record:
+                print('Resuming upload after record {}'.format(start_record))
+            on_commit = functools.partial(journal.commit, dataset_name, source_hash)
+
+        json_file_path = file_path + '.json'
+        # Resuming seeks to the committed offset in the JSON file, so a
+        # journaled upload always goes through the file, even if streaming
+        if streaming and journal is None:
+            lines = self.json_create_lines(file_path, id_field, encoding=encoding, delimiter=delimiter,
+                                           processes=processes)
+        else:
+            # The JSON file of an interrupted upload can be reused as is
+            resuming = start_record and os.path.exists(json_file_path)
+            if (create_json or streaming) and not resuming:
+                self.write_json_create_file(file_path, id_field, json_file_path, encoding=encoding,
+                                            delimiter=delimiter, processes=processes)
+                start_record = 0
+                start_offset = None
+            lines = self.get_data(json_file_path, offset=start_offset or 0)
+
+        report = self.upload_chunks(dataset_name, lines,
+                                    chunk_records=chunk_records, chunk_bytes=chunk_bytes,
+                                    workers=workers, max_retries=max_retries,
+                                    start_record=start_record, start_offset=start_offset,
+                                    on_commit=on_commit)
+        if journal is not None:
+            journal.clear(dataset_name, source_hash)
+        return report
+
+    def update_dataset_delta(self, dataset_name, file_path, id_field, index_path, delimiter=',', encoding='utf-8',
+                             chunk_records=DEFAULT_CHUNK_RECORDS, chunk_bytes=None, workers=4, max_retries=5):
+        """
+        Upserts only the records that changed since the previous delta update
+        of this dataset, and deletes records that are no longer in the csv
+        (see: json_delta_lines). The index at index_path is only replaced
+        once every chunk has been uploaded, so a failed run can be repeated.
+        If index_path does not exist yet, every record is uploaded.
+        :param dataset_name:
+        :param file_path:
+        :param id_field:
+        :param index_path: Path to index of record ids and content digests
+        :param delimiter:
+        :param encoding:
+        :param chunk_records:
+        :param chunk_bytes:
+        :param workers:
+        :param max_retries:
+        :return: dict with totals and throughput of the upload
+        """
+        print('Updating Dataset with changed records')
+        lines = self.json_delta_lines(file_path, id_field, index_path, encoding=encoding, delimiter=delimiter)
+        report = self.upload_chunks(dataset_name, lines,
+                                    chunk_records=chunk_records, chunk_bytes=chunk_bytes,
+                                    workers=workers, max_retries=max_retries)
+        os.replace(index_path + '.new', index_path)
+        return report
+
     @check_status(success_code=200)
-    def update_dataset(self, dataset_name, file_path, id_field, delimiter=',', encoding='utf-8', create_json=True):
+    def update_dataset(self, dataset_name, file_path, id_field, delimiter=',', encoding='utf-8', create_json=True,
+                       streaming=False, processes=None):
         """
         Uploads content of records from csv. Assumes dataset has already been
         created (see: create method). Can be used for initial loading
@@ -231,15 +1351,23 @@ class TamrAPI(object):
         :param delimiter:
         :param encoding:
         :param create_json:
+        :param streaming: If True, convert and upload the csv in a single pass
+                          without writing a JSON file. create_json is ignored.
+        :param processes: Number of processes used to parse the csv
         :return:
         """
 
         print('Updating Dataset')
+        if streaming:
+            return self.stream_records(dataset_name, file_path, id_field, delimiter=delimiter, encoding=encoding,
+                                       processes=processes)
+
         json_file_path = file_path + '.json'
 
         # Create JSON CREATE file
         if create_json:
-            self.write_json_create_file(file_path, id_field, json_file_path, encoding=encoding, delimiter=delimiter)
+            self.write_json_create_file(file_path, id_field, json_file_path, encoding=encoding, delimiter=delimiter,
+                                        processes=processes)
 
         # Upload records
         response = self.upload_records(dataset_name, json_file_path, encoding=encoding)
@@ -251,12 +1379,11 @@ class TamrAPI(object):
         :param name:
         :return:
         """
-        response = self.get_datasets()
-        existing_datasets = [entry['data']['name'] for entry in response.json()]
-        return name in existing_datasets
+        return self.dataset_id(name) is not None
 
     @check_status(success_code=200)
     def initialize_unified_dataset(self, project_id, unified_dataset_name):
+        self.invalidate_metadata('datasets')
         response = self.client.post('/recipe/projects/init/{}'.format(project_id),
                                     json={"unifiedDatasetName": unified_dataset_name
                                           }
@@ -277,6 +1404,35 @@ class TamrAPI(object):
                                   )
         return response
 
+    def iter_cluster_ids(self, unified_dataset_name, query='', sort='', name='',
+                         page_size=1000, workers=4, ordered=True):
+        """
+        Generator of all clusters matching the query, fetched a page at a time
+        over concurrent requests. The first page is fetched alone to read the
+        total number of clusters, if the response has one.
+        :param unified_dataset_name: Name of the unified dataset
+        :param query: Tamr query
+        :param sort: Sort order, as in get_cluster_ids
+        :param name: Cluster name
+        :param page_size: Number of clusters per request
+        :param workers: Number of concurrent requests
+        :param ordered: Yield clusters in sort order. If False, pages are
+                        yielded as soon as they arrive.
+        :return: Generator of clusters, as in get_cluster_ids().json()
+        """
+        def fetch_page(offset, limit):
+            return page_items(self.get_cluster_ids(unified_dataset_name, query=query, offset=offset,
+                                                  limit=limit, sort=sort, name=name).json())[0]
+
+        clusters, total = page_items(self.get_cluster_ids(unified_dataset_name, query=query, offset=0,
+                                                         limit=page_size, sort=sort, name=name).json())
+        yield from clusters
+        if len(clusters) < page_size:
+            return
+        for page in iter_pages(fetch_page, page_size, prefetch=workers, start=page_size, total=total,
+                               ordered=ordered):
+            yield from page
+
     @check_status(success_code=200)
     def split_cluster(self, unified_dataset_name, cluster_name_field, json_file_path):
         print('Splitting cluster.')
@@ -291,6 +1447,61 @@ class TamrAPI(object):
                                    
         return response
     
+    def post_move_to_new(self, unified_dataset_name, cluster_name_field, body):
+        return self.client.post('/dedup/clusters/{}/move-to-new'.format(unified_dataset_name),
+                                headers={'Content-Type': 'application/json'},
+                                params={"clusterNameField": cluster_name_field},
+                                data=body)
+
+    def split_clusters_bulk(self, unified_dataset_name, cluster_name_field, json_file_path,
+                            batch_size=1, workers=8):
+        """
+        Same as split_cluster, but sends the moves in the JSON file over
+        concurrent requests and checks every response. With batch_size > 1,
+        that many newline-separated moves are sent per request, for servers
+        whose move-to-new endpoint accepts several moves in one body.
+        At most 2 * workers requests are read from the file ahead of the
+        responses. Moves are not retried, since repeating one would split again.
+        :param unified_dataset_name: Name of the unified dataset
+        :param cluster_name_field: Name of the column selected to represent cluster name
+        :param json_file_path: Filepath to newline-separated JSON, one move per line
+        :param batch_size: Number of moves per request
+        :param workers: Number of concurrent requests
+        :return: list with a dict per move: line (0-based, blank lines skipped),
+                 status_code (None if no response) and error (None on success)
+        """
+        print('Splitting clusters.')
+        started = time.time()
+
+        def send(chunk):
+            try:
+                response = self.post_move_to_new(unified_dataset_name, cluster_name_field, chunk.body)
+            except IOError as e:
+                logging.error("Error moving records on lines {0}-{1}: {2}".format(
+                    chunk.first_record, chunk.first_record + chunk.num_records - 1, e))
+                return chunk, None, str(e)
+            if response.status_code != 200:
+                logging.error("ERROR: Status code = {0} moving records on lines {1}-{2}: {3}".format(
+                    response.status_code, chunk.first_record, chunk.first_record + chunk.num_records - 1,
+                    response.text))
+                return chunk, response.status_code, response.text
+            return chunk, response.status_code, None
+
+        results = []
+        with open(json_file_path, 'rb') as json_file:
+            chunks = iter_chunks(json_file, max_records=batch_size)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                with contextlib.closing(bounded_starmap(executor, send, ((chunk,) for chunk in chunks),
+                                                        2 * workers)) as sent:
+                    for chunk, status_code, error in sent:
+                        for line in range(chunk.first_record, chunk.first_record + chunk.num_records):
+                            results.append({'line': line, 'status_code': status_code, 'error': error})
+
+        failed = sum(1 for result in results if result['error'] is not None)
+        print('Sent {0} moves in {1} seconds, {2} failed'.format(len(results), round(time.time() - started, 3),
+                                                                 failed))
+        return results
+
     @check_status(success_code=200)
     def assign_clusters(self, unified_dataset_name, usernames, cluster_ids):
         print('Assigning clusters.')
@@ -335,6 +1546,76 @@ class TamrAPI(object):
                                     )
         return response
 
+    @check_status(success_code=200, silent=True)
+    def get_cluster_records_page(self, unified_dataset_name, cluster_ids, offset, limit, sort_by_spend='false'):
+        return self.client.get('/transactions/{}'.format(unified_dataset_name),
+                               params={'sortBySpend': sort_by_spend,
+                                       'suppliers': ','.join(map(str, cluster_ids)),
+                                       'offset': offset,
+                                       'limit': limit})
+
+    def get_records_in_clusters(self, unified_dataset_name, cluster_ids, sort_by_spend='false', limit=100,
+                                workers=8, clusters_per_request=1, cluster_field=None):
+        """
+        Bulk get_records_in_cluster: fetches all records of many clusters over
+        concurrent requests. Clusters with more than limit records are paged
+        with offset until a short page.
+        :param unified_dataset_name: Name of the unified dataset
+        :param cluster_ids: Iterable of cluster ids
+        :param sort_by_spend: Sort by spend, default is false
+        :param limit: Records per request
+        :param workers: Number of concurrent requests
+        :param clusters_per_request: Number of clusters sent per request as a
+                                     comma-separated suppliers list, for servers
+                                     that accept one. Requires cluster_field.
+        :param cluster_field: Field of a record that holds its cluster id, used
+                              to split the records of a multi-cluster request
+        :return: Generator of (cluster id, list of records), in the order of cluster_ids
+        """
+        assert clusters_per_request == 1 or cluster_field, "Must set cluster_field to batch clusters"
+
+        def fetch(batch):
+            records = []
+            offset = 0
+            while True:
+                page, total = page_items(self.get_cluster_records_page(unified_dataset_name, batch, offset, limit,
+                                                                       sort_by_spend=sort_by_spend).json())
+                records.extend(page)
+                offset += limit
+                if len(page) < limit or (total is not None and offset >= total):
+                    break
+            if len(batch) == 1:
+                return [(batch[0], records)]
+            # The ids are sent as strings, so records are matched to them as strings
+            by_cluster = {str(cluster_id): [] for cluster_id in batch}
+            unmatched = 0
+            for record in records:
+                cluster_records = by_cluster.get(str(record.get(cluster_field)))
+                if cluster_records is None:
+                    unmatched += 1
+                else:
+                    cluster_records.append(record)
+            if unmatched:
+                logging.warning("Dropped {0} records whose {1} is not one of the requested clusters {2}".format(
+                    unmatched, cluster_field, batch))
+            return [(cluster_id, by_cluster[str(cluster_id)]) for cluster_id in batch]
+
+        def batches():
+            batch = []
+            for cluster_id in cluster_ids:
+                batch.append(cluster_id)
+                if len(batch) == clusters_per_request:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            with contextlib.closing(bounded_starmap(executor, fetch, ((batch,) for batch in batches()),
+                                                    2 * workers)) as results:
+                for clusters in results:
+                    yield from clusters
+
     @check_status(success_code=200)
     def get_assigned_clusters(self):
         print('Getting assigned clusters.')
@@ -376,34 +1657,59 @@ class TamrAPI(object):
         :param name:
         :return:
         """
-        response = self.get_datasets()
-        ids = [entry['documentId']['id'] for entry in response.json()
-               if entry['data']['name'] == name]
+        def build_index():
+            # If several datasets have the same name, the last one wins
+            return {entry['data']['name']: entry['documentId']['id']
+                    for entry in self.get_datasets().json()}
 
-        if len(ids) == 0:
-            return None
-
-        return ids.pop()
+        return self.lookup_metadata('datasets', build_index, name)
 
     @check_status(success_code=200, silent=True)
     def get_taxonomies(self):
         return self.client.get('/taxonomy/taxonomies')
 
     def get_taxonomy_id(self, name):
-        response = self.get_taxonomies()
-        ids = [entry['documentId']['id'] for entry in response.json()
-               if entry['data']['name'] == name]
-        if len(ids) == 0:
-            return None
-        return ids.pop()
+        def build_index():
+            return {entry['data']['name']: entry['documentId']['id']
+                    for entry in self.get_taxonomies().json()}
+
+        return self.lookup_metadata('taxonomies', build_index, name)
 
     @check_status(success_code=202)
     def upload_mastering_labels(self, labels, unified_dataset_name):
+        # Labels are encoded while the request body is streamed
         response = self.client.put('/dedup/pairs/labels/{}'.format(unified_dataset_name),
                                    params={"includeUserResponse":"true"},
-                                   data='\n'.join(json.dumps(l) for l in labels))
+                                   data=iter_blocks(iter_label_lines(labels)))
         return(response)
 
+    def put_mastering_labels_chunk(self, unified_dataset_name, body):
+        return self.client.put('/dedup/pairs/labels/{}'.format(unified_dataset_name),
+                               params={"includeUserResponse": "true"},
+                               data=body)
+
+    def upload_mastering_labels_chunked(self, labels, unified_dataset_name,
+                                        chunk_records=DEFAULT_CHUNK_RECORDS, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                                        workers=4, max_retries=5, backoff_seconds=2):
+        """
+        Same as upload_mastering_labels, but sends the labels in requests
+        bounded by count and size, over concurrent requests, and retries each
+        request on its own. At most 2 * workers requests are held in memory.
+        :param labels: Iterable of dicts or JSON strings, or path to a
+                       newline-separated JSON or csv file, see iter_label_lines
+        :param unified_dataset_name: Name of the unified dataset
+        :param chunk_records: Maximum number of labels per request
+        :param chunk_bytes: Maximum size of a request body in bytes
+        :param workers: Number of concurrent requests
+        :param max_retries: Number of attempts per request before giving up
+        :param backoff_seconds: Wait before the first retry, doubled on each retry
+        :return: dict with totals and throughput of the upload
+        """
+        return self.upload_chunks(unified_dataset_name, iter_label_lines(labels),
+                                  chunk_records=chunk_records, chunk_bytes=chunk_bytes,
+                                  workers=workers, max_retries=max_retries, backoff_seconds=backoff_seconds,
+                                  post=self.put_mastering_labels_chunk, success_code=202)
+
     @check_status(success_code=200)
     def post_categorization_labels(self, name,body, taxonomy, project_name):
         '''Takes a dataset name to label and the json body
@@ -431,17 +1737,48 @@ class TamrAPI(object):
         # of pssing the dataset_name and project name for all of them?
         dataset_id = self.dataset_id(dataset_name)
         tag = "recipe_{}".format(self.get_recipe_id(project_name, type='CATEGORIZATION'))
-        body = []
-        for i, row in df.iterrows():
-            record = {"datasetId": dataset_id, "recordId": row[transaction_id_field],
-                      "categoryId": row[category_id_field], "tag": tag}
-            body.append(record)
+        # Whole columns are converted to python values at once, instead of a row at a time
+        body = json_array_body(encode_categorize_lines(dataset_id, tag,
+                                                       df[transaction_id_field].tolist(),
+                                                       df[category_id_field].tolist()))
         response = self.client.post('/transactions/categorize',
                                     headers = { 'Content-Type': 'application/json',
                                                 'Accept': 'application/json'},
-                                    data=json.dumps(body))
+                                    data=body)
         return response
 
+    def post_categorize_chunk(self, body):
+        return self.client.post('/transactions/categorize',
+                                headers={'Content-Type': 'application/json',
+                                         'Accept': 'application/json'},
+                                data=body)
+
+    def post_transactions_categorize_chunked(self, df,
+                                             dataset_name,
+                                             project_name,
+                                             transaction_id_field,
+                                             category_id_field,
+                                             chunk_records=DEFAULT_CHUNK_RECORDS,
+                                             workers=4, max_retries=5, backoff_seconds=2):
+        """
+        Same as post_transactions_categorize, but sends the records in
+        requests of at most chunk_records over concurrent requests, and
+        retries each request on its own.
+        :param df: DataFrame with a column of record ids and one of category ids
+        :param chunk_records: Maximum number of records per request
+        :param workers: Number of concurrent requests
+        :param max_retries: Number of attempts per request before giving up
+        :param backoff_seconds: Wait before the first retry, doubled on each retry
+        :return: dict with totals and throughput of the upload
+        """
+        dataset_id = self.dataset_id(dataset_name)
+        tag = "recipe_{}".format(self.get_recipe_id(project_name, type='CATEGORIZATION'))
+        lines = encode_categorize_lines(dataset_id, tag,
+                                        df[transaction_id_field].tolist(),
+                                        df[category_id_field].tolist())
+        return self.upload_chunks(dataset_name, lines, chunk_records=chunk_records,
+                                  workers=workers, max_retries=max_retries, backoff_seconds=backoff_seconds,
+                                  post=lambda name, body: self.post_categorize_chunk(json_array_body(body)))
 
     @check_status(success_code=200)
     def delete_mastering_labels(self, unified_dataset_name):
@@ -464,16 +1801,91 @@ class TamrAPI(object):
 
         return response
 
+    def post_categorization_chunk(self, ds_id, taxonomy, tag, body):
+        return self.client.post(
+            '/procurement/datasets/{0}/categorizations?taxonomyName={1}&tag={2}'. \
+                format(ds_id, taxonomy, tag),
+            headers = { 'Content-Type': 'application/json',
+                        'Accept': 'application/json'},
+            data=body)
+
+    def delete_categorization_chunk(self, tag, body):
+        return self.client.delete('/transactions/categorize?tag={}'.format(tag),
+                                  headers = { 'Content-Type': 'application/json',
+                                              'Accept': 'application/json'},
+                                  data=body)
+
+    def post_categorization_labels_bulk(self, name, labels, taxonomy, project_name,
+                                        chunk_records=DEFAULT_CHUNK_RECORDS, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                                        workers=4, max_retries=5, backoff_seconds=2):
+        """
+        Same as post_categorization_labels for any number of labels, sent in
+        chunks over concurrent requests. Chunks that still fail after their
+        retries are reported instead of raised, see upload_chunks.
+        :param labels: Iterable of label dicts or JSON strings, or path to a
+                       newline-separated JSON file, see iter_label_lines
+        :return: report of upload_chunks
+        """
+        ds_id = self.dataset_id(name)
+        tag = "recipe_{}".format(self.get_recipe_id(project_name, type='CATEGORIZATION'))
+        return self.upload_chunks(name, iter_label_lines(labels), chunk_records=chunk_records,
+                                  chunk_bytes=chunk_bytes, workers=workers, max_retries=max_retries,
+                                  backoff_seconds=backoff_seconds, continue_on_error=True,
+                                  post=lambda name, body: self.post_categorization_chunk(ds_id, taxonomy, tag,
+                                                                                         json_array_body(body)))
+
+    def delete_categorization_labels_bulk(self, dataset_name, project_name, record_ids,
+                                          chunk_records=DEFAULT_CHUNK_RECORDS, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                                          workers=4, max_retries=5, backoff_seconds=2):
+        """
+        Same as delete_categorization_labels for any number of records, sent
+        in chunks over concurrent requests. Chunks that still fail after their
+        retries are reported instead of raised, see upload_chunks.
+        :param record_ids: Iterable of record ids
+        :return: report of upload_chunks
+        """
+        ds_id = self.dataset_id(dataset_name)
+        tag = "recipe_{}".format(self.get_recipe_id(project_name, type='CATEGORIZATION'))
+        prefix = b'{"datasetId":' + dumps_bytes(ds_id) + b',"recordId":'
+        lines = (prefix + dumps_bytes(record_id) + b'}\n' for record_id in record_ids)
+        return self.upload_chunks(dataset_name, lines, chunk_records=chunk_records, chunk_bytes=chunk_bytes,
+                                  workers=workers, max_retries=max_retries, backoff_seconds=backoff_seconds,
+                                  continue_on_error=True,
+                                  post=lambda name, body: self.delete_categorization_chunk(tag,
+                                                                                           json_array_body(body)))
+
     @check_status(success_code=200)
-    def get_categorization_labels(self, ds_name, taxonomy_name, project_name, type='MANUAL'):
+    def get_categorization_labels(self, ds_name, taxonomy_name, project_name, type='MANUAL', stream=False):
         ds_id = self.dataset_id(ds_name)
         tag = "recipe_{}".format(self.get_recipe_id(project_name, type='CATEGORIZATION'))
         taxonomy_id = self.get_taxonomy_id(taxonomy_name)
         response = self.client.get('/procurement/datasets/{0}/categorizations?taxonomyId={1}&tag={2}&type={3}'. \
                                    format(ds_id, taxonomy_id, tag, type),
-                                   headers = {'Content-Type': 'application/json'})
+                                   headers = {'Content-Type': 'application/json'},
+                                   stream=stream)
         return response
 
+    def iter_categorization_labels(self, ds_name, taxonomy_name, project_name, type='MANUAL'):
+        """
+        Generator of the labels of get_categorization_labels, parsed one at a
+        time as the response is downloaded instead of with .json().
+        :return: Generator of labels
+        """
+        response = self.get_categorization_labels(ds_name, taxonomy_name, project_name, type=type, stream=True)
+        try:
+            yield from iter_json_array(response.iter_content(chunk_size=DEFAULT_BLOCK_SIZE))
+        finally:
+            response.close()
+
+    def download_categorization_labels(self, ds_name, taxonomy_name, project_name, file_path, type='MANUAL'):
+        """
+        Writes the labels of get_categorization_labels to a newline-separated
+        JSON file, one label per line, without holding them in memory.
+        :return: Number of labels written
+        """
+        return write_ndjson(self.iter_categorization_labels(ds_name, taxonomy_name, project_name, type=type),
+                            file_path)
+
 
 
     @check_status(success_code=200)
@@ -513,6 +1925,225 @@ class TamrAPI(object):
 
         raise Exception("Reading dataset failed after {} tries".format(num_tries))
 
+    def get_export_stream(self, dataset_id, offset=0):
+        # Uncompressed, so Content-Length and byte ranges count the same bytes
+        # as iter_content, and a resumed download joins like with like
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = 'bytes={}-'.format(offset)
+        return self.client.get(endpoint='/export/read/dataset/{0}'.format(dataset_id),
+                               headers=headers,
+                               stream=True)
+
+    def download_dataset_export(self, name, file_path, chunk_size=DEFAULT_READ_SIZE, num_tries=20,
+                                retry_wait_seconds=5):
+        """
+        Streams the latest export of a dataset to a file. If the connection
+        fails, the download continues from the last byte written, with a
+        range request. Servers that ignore the range send the export from
+        the start again, and the bytes already written are skipped.
+        The export is written to file_path + '.part' and renamed once complete.
+        :param name: Dataset name
+        :param file_path: Path of the file to write
+        :param chunk_size: Size in bytes of each read from the connection
+        :param num_tries: Number of connections tried before giving up
+        :param retry_wait_seconds: Seconds to wait before reconnecting
+        :return: dict with bytes, seconds, bytes_per_second and tries
+        """
+        dataset_id = self.dataset_id(name)
+        part_path = file_path + '.part'
+        started = time.time()
+        received = 0
+        expected = None
+        with open(part_path, 'wb') as f:
+            for i in range(num_tries):
+                try:
+                    response = self.get_export_stream(dataset_id, offset=received)
+                    try:
+                        if response.status_code == 206:
+                            # Content-Range: bytes start-end/total
+                            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                            expected = int(total) if total.isdigit() else expected
+                            skip = 0
+                        elif response.status_code == 200:
+                            length = response.headers.get('Content-Length')
+                            expected = int(length) if length is not None else None
+                            skip = received
+                        else:
+                            logging.error("ERROR: Status code = {0}".format(response.status_code))
+                            logging.error("Response:")
+                            logging.error(json.dumps(response.text))
+                            raise AssertionError("Status code {0} != 200".format(response.status_code))
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if skip:
+                                if len(chunk) <= skip:
+                                    skip -= len(chunk)
+                                    continue
+                                chunk = chunk[skip:]
+                                skip = 0
+                            f.write(chunk)
+                            received += len(chunk)
+                    finally:
+                        response.close()
+                except (http.client.IncompleteRead,
+                        requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.ConnectionError) as e:
+                    logging.warning("Error reading export of {0} at byte {1}: {2}".format(name, received, e))
+                    logging.warning("Retrying.... Attempt {} out of {}".format(i + 1, num_tries))
+                    time.sleep(retry_wait_seconds)
+                    continue
+                if expected is not None and received != expected:
+                    logging.warning("Export of {0} ended at byte {1} of {2}".format(name, received, expected))
+                    logging.warning("Retrying.... Attempt {} out of {}".format(i + 1, num_tries))
+                    time.sleep(retry_wait_seconds)
+                    continue
+                break
+            else:
+                raise IOError("Reading export of {0} failed after {1} tries".format(name, num_tries))
+
+        os.replace(part_path, file_path)
+        seconds = time.time() - started
+        report = {'bytes': received,
+                  'seconds': round(seconds, 3),
+                  'bytes_per_second': round(received / seconds) if seconds else None,
+                  'tries': i + 1}
+        print('Downloaded export of {0}: {1}'.format(name, report))
+        return report
+
+    def ensure_export(self, name, version=None, timeout_seconds=3600,
+                      min_poll_interval_seconds=1, max_poll_interval_seconds=30):
+        """
+        Materializes an export of the dataset only if the latest export is
+        older than the dataset version, and waits until it is done. The
+        export takes the dataset version current when it starts, so it can
+        be newer than version if the dataset was updated in between.
+        :param name: Dataset name
+        :param version: Dataset version, if already known
+        :param timeout_seconds: Raise TimeoutError if the export is not done after this long
+        :param min_poll_interval_seconds: Wait before the first check of the export revision
+        :param max_poll_interval_seconds: Cap on the wait between checks, which doubles after each one
+        :return: Revision of the export, at least version
+        """
+        if version is None:
+            version = self.get_dataset_version(name)
+        revision = self.get_export_revision(name)
+        if revision is not None and revision >= version:
+            return revision
+
+        response = self.materialize_dataset_export(name)
+        # The export runs as a job. If the response names it, the job is
+        # polled too, so a failed export is reported at once
+        try:
+            body = response.json()
+            job_id = body['documentId']['id'] if 'documentId' in body else body.get('id')
+        except (ValueError, TypeError, KeyError, AttributeError):
+            job_id = None
+
+        started = time.time()
+        interval = min_poll_interval_seconds
+        while True:
+            revision = self.get_export_revision(name)
+            if revision is not None and revision >= version:
+                return revision
+            if job_id is not None:
+                job = self.get_job(job_id).json()
+                if job['data']['status']['state'] == 'FAILED':
+                    message = 'Export of {0} failed, see job {1}: {2}'.format(name, job_id,
+                                                                             json.dumps(job['data']['status']))
+                    logging.error(message)
+                    raise Exception(message)
+            if time.time() - started >= timeout_seconds:
+                message = 'Export of {0} did not finish within {1} seconds'.format(name, timeout_seconds)
+                logging.error(message)
+                raise TimeoutError(message)
+            time.sleep(interval)
+            interval = min(interval * 2, max_poll_interval_seconds)
+
+    def get_export_file(self, name, cache_dir, timeout_seconds=3600, keep_revisions=1):
+        """
+        Returns the path of a local copy of the latest export of a dataset.
+        Copies are kept in cache_dir keyed by dataset id and revision, so an
+        unchanged dataset is served from disk after one metadata request.
+        Otherwise the export is materialized if needed and downloaded.
+        :param name: Dataset name
+        :param cache_dir: Directory of downloaded exports, created if needed
+        :param timeout_seconds: Raise TimeoutError if the export is not done after this long
+        :param keep_revisions: Number of revisions of the dataset kept in cache_dir
+        :return: Path to the export csv
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        dataset_id = self.dataset_id(name)
+        version = self.get_dataset_version(name)
+        prefix = '{0}-r'.format(dataset_id)
+        file_path = os.path.join(cache_dir, '{0}{1}.csv'.format(prefix, version))
+        if os.path.exists(file_path):
+            print('Export of {0} revision {1} is up to date in {2}'.format(name, version, file_path))
+            return file_path
+
+        revision = self.ensure_export(name, version=version, timeout_seconds=timeout_seconds)
+        if revision != version:
+            file_path = os.path.join(cache_dir, '{0}{1}.csv'.format(prefix, revision))
+            if os.path.exists(file_path):
+                print('Export of {0} revision {1} is up to date in {2}'.format(name, revision, file_path))
+                return file_path
+        self.download_dataset_export(name, file_path)
+
+        # Drop older revisions of the dataset
+        revisions = []
+        for file_name in os.listdir(cache_dir):
+            revision = file_name[len(prefix):-len('.csv')]
+            if file_name.startswith(prefix) and file_name.endswith('.csv') and revision.isdigit():
+                revisions.append(int(revision))
+        for revision in sorted(revisions)[:-keep_revisions]:
+            os.remove(os.path.join(cache_dir, '{0}{1}.csv'.format(prefix, revision)))
+        return file_path
+
+    def export_to_columnar(self, name, out_dir, file_format='parquet', column_types=None,
+                           rows_per_file=DEFAULT_ROWS_PER_FILE, cache_dir=None):
+        """
+        Writes the latest export of a dataset as Parquet or Arrow IPC files,
+        see write_columnar. The export is materialized first if it is stale.
+        :param name: Dataset name
+        :param out_dir: Directory to write the files to
+        :param cache_dir: If given, convert the csv cached by get_export_file
+                          instead of converting the export as it is downloaded
+        :return: dict with rows, files and seconds
+        """
+        if cache_dir is not None:
+            csv_path = self.get_export_file(name, cache_dir)
+            report = write_columnar(csv_path, out_dir, file_format=file_format, column_types=column_types,
+                                    rows_per_file=rows_per_file)
+        else:
+            self.ensure_export(name)
+            response = self.get_export_stream(self.dataset_id(name))
+            try:
+                if response.status_code != 200:
+                    logging.error("ERROR: Status code = {0}".format(response.status_code))
+                    logging.error("Response:")
+                    logging.error(json.dumps(response.text))
+                    raise AssertionError("Status code {0} != 200".format(response.status_code))
+                response.raw.decode_content = True
+                report = write_columnar(response.raw, out_dir, file_format=file_format,
+                                        column_types=column_types, rows_per_file=rows_per_file)
+            finally:
+                response.close()
+        print('Exported {0} to {1}: {2}'.format(name, out_dir, report))
+        return report
+
+    def export_datasets_to_columnar(self, names, out_dir, workers=4, **kwargs):
+        """
+        Runs export_to_columnar for several datasets concurrently, each to
+        out_dir/<dataset name>.
+        :param names: Dataset names
+        :param workers: Number of datasets exported at a time
+        :param kwargs: Passed to export_to_columnar
+        :return: dict of dataset name -> report
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(self.export_to_columnar, name, os.path.join(out_dir, name), **kwargs)
+                       for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
     @check_status(success_code=200)
     def post_export_query(self, name):
         return self.client.post(endpoint='/export/query',
@@ -546,52 +2177,146 @@ class TamrAPI(object):
             raise
 
     def get_latest_job_id(self, description=None):
-        response = self.get_jobs()
-        # find job containing description text
-        jobs = response.json()
+        """
+        Returns the id of the newest job whose description contains
+        description, or of the newest job if description is None.
+
+        The job listing, newest first, is parsed as it is downloaded and
+        the download stops at the first match. The jobs read are remembered,
+        so later lookups only read jobs newer than those, unless the match
+        is older than all remembered jobs.
+        :param description: Text to find in the job description
+        :return: job id, or None if no job matches
+        """
+        def matches(job_description):
+            return description is None or job_description.find(description) > -1
+
+        known_ids = set(job_id for job_id, _ in self.recent_jobs)
+        newer = []
+        older = []
         job_id = None
-        for job in jobs:
-            if description is not None:
-                if job['data']['description'].find(description) > -1:
-                    job_id = job['documentId']['id']
+        reached_known = False
+        response = self.get_jobs()
+        try:
+            for job in iter_json_array(response.iter_content(chunk_size=DEFAULT_BLOCK_SIZE)):
+                entry = (job['documentId']['id'], job['data']['description'])
+                if entry[0] in known_ids:
+                    if not reached_known:
+                        reached_known = True
+                        job_id = next((known_id for known_id, known_description in self.recent_jobs
+                                       if matches(known_description)), None)
+                        if job_id is not None:
+                            break
+                    continue
+                (older if reached_known else newer).append(entry)
+                if matches(entry[1]):
+                    job_id = entry[0]
                     break
-            else:
-                job_id = job['documentId']['id']
-                break
-        if job_id == None:
+        finally:
+            response.close()
+
+        # Keep the remembered jobs a contiguous run from the newest job
+        if reached_known:
+            self.recent_jobs = newer + self.recent_jobs + older
+        else:
+            self.recent_jobs = newer
+        del self.recent_jobs[MAX_RECENT_JOBS:]
+
+        if job_id is None:
             logging.warning('Job ID not found, check your dataset name')
         return job_id
 
     def wait_for_job(self, job_id,
-                     poll_interval_seconds=5,
+                     poll_interval_seconds=None,
                      timeout_seconds=3600,
-                     post_spark_wait_seconds=10):
+                     post_spark_wait_seconds=0,
+                     on_state_change=None):
+        """
+        Waits for a job to finish, polling quickly at first and backing off
+        for long jobs. See wait_for_jobs.
+        :param poll_interval_seconds: Fixed interval between polls, None to back off
+        :return: (True if the job succeeded, requests.Response of the last poll)
+        """
+        return self.wait_for_jobs([job_id],
+                                  poll_interval_seconds=poll_interval_seconds,
+                                  timeout_seconds=timeout_seconds,
+                                  post_spark_wait_seconds=post_spark_wait_seconds,
+                                  on_state_change=on_state_change)[job_id]
+
+    def wait_for_jobs(self, job_ids,
+                      poll_interval_seconds=None,
+                      timeout_seconds=3600,
+                      post_spark_wait_seconds=0,
+                      on_state_change=None,
+                      min_poll_interval_seconds=1,
+                      max_poll_interval_seconds=30,
+                      backoff=1.5,
+                      jitter=0.1):
+        """
+        Waits for several jobs to finish with a single polling loop. Each job
+        is polled on its own schedule, starting every min_poll_interval_seconds
+        and growing by backoff up to max_poll_interval_seconds, so short jobs
+        are seen finishing quickly and long ones are not polled needlessly.
+        :param job_ids: Iterable of job ids
+        :param poll_interval_seconds: Fixed interval between polls, None to back off
+        :param timeout_seconds: Raise TimeoutError if jobs are still running after this long
+        :param post_spark_wait_seconds: Seconds to sleep after all jobs finished, if any succeeded
+        :param on_state_change: Function of (job_id, state, response) called when a
+                                job is first seen and whenever its state changes
+        :param jitter: Fraction by which each interval is randomly varied, so that
+                       jobs started together are not polled together
+        :return: dict of job_id -> (True if the job succeeded, requests.Response of the last poll)
+        """
+        if poll_interval_seconds is not None:
+            min_poll_interval_seconds = max_poll_interval_seconds = poll_interval_seconds
+            backoff = 1
         started = time.time()
-        succeeded = False
-        logging.info("Waiting for job...")
-        while time.time() - started < timeout_seconds:
-            response = self.get_job(job_id)
-            status = response.json()['data']['status']['state']
-
-            if status == 'SUCCEEDED':
-                time.sleep(post_spark_wait_seconds)
-                return True, response
-            elif status == 'FAILED':
-                return False, response
-            elif status == 'PENDING':
-                time.sleep(poll_interval_seconds)
-            elif status == 'RUNNING':
-                time.sleep(poll_interval_seconds)
-            else:
-                message = 'Unhandled status: {}'.format(status)
+        intervals = {}
+        next_poll = {}
+        for job_id in job_ids:
+            intervals[job_id] = min_poll_interval_seconds
+            next_poll[job_id] = started
+        states = {}
+        results = {}
+        logging.info("Waiting for {} job(s)...".format(len(next_poll)))
+        while next_poll:
+            now = time.time()
+            if now - started >= timeout_seconds:
+                message = 'Job(s) {0} did not ' \
+                          'finish within {1} seconds'.format(', '.join(map(str, next_poll)),
+                                                             timeout_seconds)
                 logging.error(message)
-                raise ValueError(message)
+                raise TimeoutError(message)
+            due = [job_id for job_id, poll_time in next_poll.items() if poll_time <= now]
+            if not due:
+                time.sleep(min(min(next_poll.values()), started + timeout_seconds) - now)
+                continue
+            for job_id in due:
+                response = self.get_job(job_id)
+                status = response.json()['data']['status']['state']
+                if status != states.get(job_id):
+                    states[job_id] = status
+                    if on_state_change is not None:
+                        on_state_change(job_id, status, response)
+
+                if status == 'SUCCEEDED':
+                    results[job_id] = (True, response)
+                    del next_poll[job_id]
+                elif status == 'FAILED':
+                    results[job_id] = (False, response)
+                    del next_poll[job_id]
+                elif status in ('PENDING', 'RUNNING'):
+                    interval = intervals[job_id]
+                    next_poll[job_id] = time.time() + interval * random.uniform(1 - jitter, 1 + jitter)
+                    intervals[job_id] = min(interval * backoff, max_poll_interval_seconds)
+                else:
+                    message = 'Unhandled status: {}'.format(status)
+                    logging.error(message)
+                    raise ValueError(message)
 
-        message = 'Job {0} did not ' \
-                  'finish within {1} seconds'.format(job_id,
-                                                     timeout_seconds)
-        logging.error(message)
-        raise StandardError(message)
+        if post_spark_wait_seconds and any(succeeded for succeeded, _ in results.values()):
+            time.sleep(post_spark_wait_seconds)
+        return results
 
     @check_status(success_code=200)
     def get_pairs_export(self, tag):
@@ -621,6 +2346,22 @@ class TamrAPI(object):
                                            "offset":offset})
         return response
 
+    def iter_pair_labels(self, unified_dataset_name, manual_label, page_size=5000, prefetch=4):
+        """
+        Generator of all pairs from mastering project that match manual_label.
+        The next pages are fetched concurrently while the current one is consumed.
+        :param unified_dataset_name: unified dataset name of the mastering project
+        :param manual_label: options include MISSING, MATCH, NON_MATCH
+        :param page_size: number of pairs per request, upper bound is 5000
+        :param prefetch: number of pages requested at a time
+        :return: Generator of pairs, as in get_pair_labels().json()['items']
+        """
+        def fetch_page(offset, limit):
+            return self.get_pair_labels(unified_dataset_name, offset, manual_label, limit=limit).json()['items']
+
+        for page in iter_pages(fetch_page, page_size, prefetch=prefetch):
+            yield from page
+
     @check_status(success_code=200)
     def get_clusters_export(self, tag):
         """
@@ -646,19 +2387,33 @@ class TamrAPI(object):
                                         'Accept': 'application/json'})
 
     def get_project_id(self, name, description=None):
-        response = self.get_projects()
-        blob = response.json()
-        for doc in blob:
-            if doc['data']['name'] != name:
-                continue
-            if description is not None and \
-                            doc['data']['description'] != description:
+        def build_index():
+            # name -> [(description, id)] in listing order
+            index = {}
+            for doc in self.get_projects().json():
+                index.setdefault(doc['data']['name'], []).append(
+                    (doc['data']['description'], doc['documentId']['id']))
+            return index
+
+        for project_description, project_id in self.lookup_metadata('projects', build_index, name) or []:
+            if description is not None and project_description != description:
                 continue
-            return doc['documentId']['id']
+            return project_id
         return None
 
-    def get_clusters(self, tag):
-        with generate_clusters(self.get_clusters_export(tag)) as clusters:
+    def get_clusters(self, tag, compact=False):
+        """
+        Returns a map of recordId -> clusterId of all clusters.
+        :param tag: the schema mapping recipe id for your project e.g. recipe_2
+        :param compact: If True, return a CompactClusterMap, which has the same
+                        read interface as a dict but needs much less memory
+        :return: dict or CompactClusterMap
+        """
+        response = self.get_clusters_export(tag)
+        if compact:
+            with generate_clusters(response) as clusters:
+                return CompactClusterMap.from_clusters(clusters)
+        with generate_clusters(response, fields=('recordId', 'clusterId')) as clusters:
             # Clusters have the structure
             # {
             #     u'recordId': u'1234567',
@@ -668,12 +2423,23 @@ class TamrAPI(object):
             # Create a map from recordId -> clusterId
             # If we were dealing with more than one dataset, we would want it to be
             # a map from (datasetName, recordId) -> clusterId
-            cluster_dict =  {
-                cluster['recordId']: cluster['clusterId']
-                for cluster in clusters
-            }
+            cluster_dict = {}
+            for batch in clusters.batches():
+                cluster_dict.update(batch)
         return cluster_dict
 
+    def get_clusters_store(self, tag, path, run_size=DEFAULT_RUN_SIZE):
+        """
+        Same as get_clusters, but streams the export into an on-disk
+        ClusterStore instead of a dict, for exports too large for memory.
+        :param tag: the schema mapping recipe id for your project e.g. recipe_2
+        :param path: Directory to write the store to
+        :param run_size: Number of records sorted in memory at a time
+        :return: ClusterStore, which should be closed after use
+        """
+        with generate_clusters(self.get_clusters_export(tag)) as clusters:
+            return ClusterStore.build(clusters, path, run_size=run_size)
+
     @check_status(success_code=202)
     def recipes_populate(self, recipe_id):
         #note, this should be the recipe id for the pairs/clusters (i.e. 3 for a lone project)
@@ -705,17 +2471,19 @@ class TamrAPI(object):
         """
         assert project_name is not None, "Project name not specified."
 
-        response = self.get_recipes()
-
-        for document in response.json():
-            if document['data']['project'] != project_name:
-                continue
-            if document['data']['type'] != type:
-                continue
-            recipe_id = document['documentId']['id']
-            return int(recipe_id)
-        logging.error("Couldn't find recipe id for project =",
-                      project_name, "and type =", type)
+        def build_index():
+            # (project, type) -> id of the first matching recipe
+            index = {}
+            for document in self.get_recipes().json():
+                index.setdefault((document['data']['project'], document['data']['type']),
+                                 int(document['documentId']['id']))
+            return index
+
+        recipe_id = self.lookup_metadata('recipes', build_index, (project_name, type))
+        if recipe_id is not None:
+            return recipe_id
+        logging.error("Couldn't find recipe id for project = %s and type = %s",
+                      project_name, type)
         sys.exit(1)
 
     @check_status(success_code=200, silent=True)
@@ -754,7 +2522,7 @@ class TamrAPI(object):
 
 
     @check_status(success_code=200)
-    def get_user_responses(self, user):
+    def get_user_responses(self, user, stream=False):
         """Returns json of user response information.
         Must used credentials of the user of interest"""
         data = {'filters': [
@@ -775,9 +2543,30 @@ class TamrAPI(object):
         response = self.client.post(endpoint='/persistence/ns/feedback/query',
                                     headers={'Content-Type': 'application/json',
                                              'Accept': 'application/json'} ,
-                                    data=data)
+                                    data=data,
+                                    stream=stream)
         return response
 
+    def iter_user_responses(self, user):
+        """
+        Generator of the responses of get_user_responses, parsed one at a
+        time as the response is downloaded instead of with .json().
+        :return: Generator of user responses
+        """
+        response = self.get_user_responses(user, stream=True)
+        try:
+            yield from iter_json_array(response.iter_content(chunk_size=DEFAULT_BLOCK_SIZE))
+        finally:
+            response.close()
+
+    def download_user_responses(self, user, file_path):
+        """
+        Writes the responses of get_user_responses to a newline-separated
+        JSON file, one response per line, without holding them in memory.
+        :return: Number of responses written
+        """
+        return write_ndjson(self.iter_user_responses(user), file_path)
+
     @check_status(success_code=200)
     def set_user_preferences(self, user, preferences):
         # This will only work if the client is configured to use the auth service!
@@ -797,7 +2586,203 @@ class TamrAPI(object):
                                headers={'Accept': 'application/json'} )
 
 
-def generate_clusters(response):
+def iter_ndjson_blocks(chunks):
+    """
+    Regroups a stream of byte chunks into blocks of complete lines, so each
+    block can be decoded at once. A line split across chunks is carried
+    over to the next block.
+    :param chunks: Iterable of bytes, e.g. Response.iter_content(DEFAULT_READ_SIZE)
+    :return: Generator of bytes, without a trailing newline
+    """
+    tail = b''
+    for chunk in chunks:
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            tail += chunk
+            continue
+        block = tail + chunk[:end] if tail else chunk[:end]
+        tail = chunk[end + 1:]
+        if block:
+            yield block
+    if tail.strip():
+        yield tail
+
+
+def decode_ndjson_block(block, fields=None):
+    """
+    Decodes a block of newline-separated JSON documents with a single parser
+    call, by reading it as the elements of one JSON array. The garbage
+    collector is left alone; a single-threaded caller decoding many blocks
+    may pause it around its own loop.
+    :param block: bytes of complete lines
+    :param fields: If given, return a tuple of these fields of each document
+                   instead of the whole document
+    :return: list of documents
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    try:
+        documents = loads(b'[' + block.replace(b'\n', b',') + b']')
+    except ValueError:
+        # Blank lines make empty array elements, so drop them and try again
+        documents = loads(b'[' + b','.join(line for line in block.split(b'\n') if line.strip()) + b']')
+    if fields is None:
+        return documents
+    if len(fields) == 1:
+        field = fields[0]
+        return [(document[field],) for document in documents]
+    get_fields = operator.itemgetter(*fields)
+    return [get_fields(document) for document in documents]
+
+
+def iter_json_array(chunks):
+    """
+    Parses a JSON array incrementally from a stream of byte chunks and
+    yields its elements, so only one element has to be held in memory.
+    :param chunks: Iterable of bytes, e.g. Response.iter_content(DEFAULT_BLOCK_SIZE)
+    :return: Generator of elements
+    """
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    eof = False
+    # What comes next: '[', an element or ']', or ',' or ']'
+    expected = '['
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        need_more = pos == len(buffer)
+        if not need_more:
+            char = buffer[pos]
+            if expected == '[':
+                if char != '[':
+                    raise ValueError('Expected a JSON array, got {!r}'.format(buffer[pos:pos + 20]))
+                expected = 'element'
+                pos += 1
+                continue
+            if char == ']':
+                return
+            if expected == ',':
+                if char != ',':
+                    raise ValueError('Expected , or ] in JSON array, got {!r}'.format(buffer[pos:pos + 20]))
+                expected = 'element'
+                pos += 1
+                continue
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                need_more = True
+            else:
+                # A number cut by a chunk boundary, e.g. at '.' or 'e', decodes
+                # as a shorter number, so an element only counts as complete
+                # once the , or ] after it has arrived
+                after = end
+                while after < len(buffer) and buffer[after] in ' \t\r\n':
+                    after += 1
+                if eof or (after < len(buffer) and buffer[after] in ',]'):
+                    yield value
+                    pos = after
+                    expected = ','
+                    continue
+                need_more = True
+        if eof:
+            raise ValueError('Unexpected end of JSON array')
+        chunk = next(chunks, None)
+        eof = chunk is None
+        buffer = buffer[pos:] + text_decoder.decode(chunk or b'', final=eof)
+        pos = 0
+
+
+def write_ndjson(documents, file_path):
+    """
+    Writes documents to a newline-separated JSON file, one per line.
+    The file is written to file_path + '.part' and renamed once complete.
+    :param documents: Iterable of JSON serializable documents
+    :param file_path: Path of the file to write
+    :return: Number of documents written
+    """
+    count = 0
+
+    def lines():
+        nonlocal count
+        for document in documents:
+            count += 1
+            yield dumps_bytes(document) + b'\n'
+
+    part_path = file_path + '.part'
+    with open(part_path, 'wb') as f:
+        for block in iter_blocks(lines()):
+            f.write(block)
+    os.replace(part_path, file_path)
+    return count
+
+
+def iter_ndjson_batches(chunks, fields=None, processes=None):
+    """
+    Decodes a stream of newline-separated JSON documents a block at a time.
+    :param chunks: Iterable of bytes, e.g. Response.iter_content(DEFAULT_READ_SIZE)
+    :param fields: If given, yield tuples of these fields instead of whole documents
+    :param processes: If given, decode blocks over this many processes while
+                      the stream is read. Batches are yielded in stream order.
+    :return: Generator of lists of documents
+    """
+    blocks = iter_ndjson_blocks(chunks)
+    if not processes:
+        for block in blocks:
+            yield decode_ndjson_block(block, fields)
+        return
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        yield from bounded_starmap(executor, decode_ndjson_block, ((block, fields) for block in blocks),
+                                   2 * processes)
+
+
+def generate_records(response, fields=None, processes=None, read_size=DEFAULT_READ_SIZE):
+    """
+    Given a Requests.Response prepared to stream newline-separated JSON,
+    as from get_clusters_export() or get_pairs_export(), return a generator
+    that yields its documents. The returned generator must be closed, see
+    generate_clusters.
+
+    The response is read in blocks of read_size bytes and each block is
+    decoded in one call. Batches of documents are also available from
+    the generator's batches() method.
+    :param response: Requests.Response
+    :param fields: If given, yield tuples of these fields instead of whole documents
+    :param processes: If given, decode over this many processes
+    :param read_size: Size in bytes of each read from the response
+    :return: Generator that yields documents.
+    """
+    class RecordGenerator:
+        def __init__(self, response):
+            self.response = response
+
+        def batches(self):
+            return iter_ndjson_batches(self.response.iter_content(chunk_size=read_size),
+                                       fields=fields, processes=processes)
+
+        def __iter__(self):
+            for batch in self.batches():
+                yield from batch
+
+        def close(self):
+            self.response.close()
+
+    return contextlib.closing(
+        RecordGenerator(response)
+    )
+
+
+def generate_pairs(response, fields=None, processes=None):
+    """
+    Same as generate_clusters, for a response from get_pairs_export().
+    """
+    return generate_records(response, fields=fields, processes=processes)
+
+
+def generate_clusters(response, fields=None, processes=None):
     """
     Given a Requests.Response prepared to stream clusters, return a generator that yields clusters.
 
@@ -811,22 +2796,11 @@ def generate_clusters(response):
 
 
     :param response: Requests.Response, as from get_clusters_export()
+    :param fields: If given, yield tuples of these fields instead of whole clusters,
+                   e.g. ('recordId', 'clusterId')
+    :param processes: If given, decode over this many processes
     :return: Generator that yields clusters.
     """
-    class ClusterGenerator:
-        def __init__(self, response):
-            self.response = response
-            self.lines = response.iter_lines()
-
-        def __iter__(self):
-            for line in self.lines:
-                yield json.loads(line.decode('utf-8'))
-
-        def close(self):
-            self.response.close()
-
     # We want the close to be separate from iteration so clients will properly close
     # even if they don't consume the entire response.
-    return contextlib.closing(
-        ClusterGenerator(response)
-    )
+    return generate_records(response, fields=fields, processes=processes)
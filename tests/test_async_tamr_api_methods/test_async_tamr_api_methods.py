@@ -0,0 +1,48 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+try:
+    import common.async_tamr_api_methods as mod
+except ImportError:
+    mod = None
+
+
+@unittest.skipIf(mod is None, "aiohttp is not installed")
+class TestModule(unittest.TestCase):
+
+    def test_split_cluster_failed_move(self):
+        finished = []
+
+        async def request(self, method, endpoint, params=None, json_body=None, data=None, headers=None):
+            record_id = json.loads(data)['recordIds'][0]
+            if record_id == '1':
+                return mod.AsyncResponse(method, endpoint, data, 500, 'error')
+            if record_id == '2':
+                raise mod.aiohttp.ClientConnectionError('reset')
+            # The failures come first, the other moves still finish
+            await asyncio.sleep(0.01)
+            finished.append(record_id)
+            return mod.AsyncResponse(method, endpoint, data, 200, '{}')
+
+        api = mod.AsyncTamrAPI('localhost', 'http', 9100, 'user', 'pw')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_file_path = os.path.join(tmp_dir, 'moves.json')
+            with open(json_file_path, 'w') as f:
+                for record_id in range(4):
+                    f.write(json.dumps({'recordIds': [str(record_id)]}) + '\n\n')
+            with mock.patch.object(mod.AsyncTamrAPI, 'request', request), self.assertLogs(level='ERROR') as logs:
+                results = asyncio.run(api.split_cluster('ud', 'name', json_file_path))
+        self.assertEqual(sorted(finished), ['0', '3'])
+        self.assertEqual([result.status_code for result in results[::3]], [200, 200])
+        self.assertIsInstance(results[1], AssertionError)
+        self.assertIsInstance(results[2], mod.aiohttp.ClientConnectionError)
+        self.assertTrue(any('line 1' in line for line in logs.output))
+        self.assertTrue(any('line 2' in line for line in logs.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
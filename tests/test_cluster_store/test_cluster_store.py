@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+from common.cluster_store import ClusterStore, CompactClusterMap
+
+
+class TestModule(unittest.TestCase):
+
+    def setUp(self):
+        self.clusters = [{'recordId': 'b', 'datasetName': 'ds', 'clusterId': 'cluster-2'},
+                         {'recordId': 'a', 'datasetName': 'ds', 'clusterId': 'cluster-1'},
+                         {'recordId': 'c', 'datasetName': 'ds', 'clusterId': 'cluster-1'},
+                         {'recordId': 'd', 'datasetName': 'ds', 'clusterId': 'cluster-3'},
+                         {'recordId': 'b', 'datasetName': 'ds', 'clusterId': 'cluster-1'}]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_lookups(self):
+        # A run size smaller than the stream exercises the merge of sorted runs
+        with ClusterStore.build(iter(self.clusters), self.tmp_dir.name, run_size=2) as store:
+            self.assertEqual(len(store), 4)
+            self.assertEqual(store['a'], 'cluster-1')
+            self.assertEqual(store['b'], 'cluster-1')
+            self.assertEqual(store.get('e'), None)
+            self.assertRaises(KeyError, store.__getitem__, 'e')
+            self.assertEqual(list(store.clusters()), ['cluster-1', 'cluster-2', 'cluster-3'])
+            self.assertEqual(store.cluster_records('cluster-1'), ['a', 'b', 'c'])
+            self.assertEqual(store.cluster_records('cluster-2'), [])
+            self.assertEqual(list(store.items()), [('a', 'cluster-1'), ('b', 'cluster-1'),
+                                                   ('c', 'cluster-1'), ('d', 'cluster-3')])
+
+    def test_reopen(self):
+        ClusterStore.build(iter(self.clusters), self.tmp_dir.name).close()
+        with ClusterStore(self.tmp_dir.name) as store:
+            self.assertEqual(store['d'], 'cluster-3')
+
+    def test_compact_cluster_map(self):
+        cluster_map = CompactClusterMap.from_clusters(iter(self.clusters))
+        self.assertEqual(len(cluster_map), 4)
+        self.assertEqual(cluster_map['b'], 'cluster-1')
+        self.assertNotIn('e', cluster_map)
+        self.assertEqual(dict(cluster_map.items()), {'a': 'cluster-1', 'b': 'cluster-1',
+                                                     'c': 'cluster-1', 'd': 'cluster-3'})
+        self.assertEqual(cluster_map.cluster_records('cluster-1'), ['b', 'a', 'c'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from common.concurrency import bounded_starmap
+
+
+def delayed(value, seconds):
+    time.sleep(seconds)
+    return value
+
+
+class TestModule(unittest.TestCase):
+
+    def test_ordered(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = bounded_starmap(executor, delayed, ((i, 0.01 * (i % 3)) for i in range(20)), 4)
+            self.assertEqual(list(results), list(range(20)))
+
+    def test_unordered(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = bounded_starmap(executor, delayed, ((i, 0.01 * (i % 3)) for i in range(20)), 4,
+                                      ordered=False)
+            self.assertEqual(sorted(results), list(range(20)))
+
+    def test_max_pending(self):
+        drawn = []
+
+        def arguments():
+            for i in range(50):
+                drawn.append(i)
+                yield i, 0
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for count, value in enumerate(bounded_starmap(executor, delayed, arguments(), 3, ordered=False)):
+                self.assertLessEqual(len(drawn) - count, 3)
+
+    def test_close_cancels(self):
+        ran = []
+
+        def record(i):
+            time.sleep(0.01)
+            ran.append(i)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            results = bounded_starmap(executor, record, ((i,) for i in range(100)), 5)
+            next(results)
+            results.close()
+        # Calls queued but not started when the generator was closed never run
+        self.assertLess(len(ran), 10)
+
+    def test_error(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = bounded_starmap(executor, divmod, [(4, 2), (1, 0), (3, 1)], 2)
+            self.assertEqual(next(results), (2, 0))
+            self.assertRaises(ZeroDivisionError, next, results)
+
+
+if __name__ == "__main__":
+    unittest.main()
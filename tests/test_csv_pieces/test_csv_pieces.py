@@ -0,0 +1,87 @@
+import os
+import io
+import csv
+import tempfile
+import unittest
+from common.csv_pieces import split_csv, read_csv_piece, map_csv_pieces, iter_piece_rows, csv_header_fields, \
+    open_csv_at, CsvSplitError
+
+
+def count_rows(file_path, start, end):
+    return len(list(csv.reader(io.StringIO(read_csv_piece(file_path, start, end), newline=''))))
+
+
+class TestModule(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, 'test.csv')
+        rows = [['id', 'text', 'note']]
+        for i in range(40):
+            rows.append([str(i), 'line one\nline "two"\r\nline three' * (i % 3), '"' * (i % 4) + ',\n' * (i % 2)])
+        with open(self.file_path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        with open(self.file_path, 'rb') as f:
+            self.data = f.read()
+        self.rows = rows
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_split_csv(self):
+        # Small pieces and reads put quoted newlines and doubled quotes on every kind of boundary
+        for piece_size in (1, 7, 50, 1000):
+            for read_size in (1, 2, 3, 13, 64, 1 << 20):
+                header, pieces = split_csv(self.file_path, piece_size=piece_size, read_size=read_size)
+                self.assertEqual(header, b'id,text,note\r\n')
+                self.assertEqual(header + b''.join(self.data[start:end] for start, end in pieces), self.data)
+                parsed = [list(csv.reader(io.StringIO(read_csv_piece(self.file_path, start, end), newline='')))
+                          for start, end in pieces]
+                self.assertTrue(all(parsed))
+                self.assertEqual([row for rows in parsed for row in rows], self.rows[1:])
+
+    def test_split_csv_stray_quote(self):
+        # A bare quote in an unquoted field is a literal to csv.reader, but
+        # throws off split_csv's count, so it splits inside a quoted field
+        rows = [['id', 'desc']] + [[str(i), 'line\none' if i % 7 == 3 else 'plain'] for i in range(40)]
+        rows[6][1] = '12" pipe'
+        with open(self.file_path, 'w', newline='') as f:
+            for row in rows:
+                if row[1] == '12" pipe':
+                    f.write('5,12" pipe\r\n')
+                else:
+                    csv.writer(f).writerow(row)
+        header, pieces = split_csv(self.file_path, piece_size=30)
+        self.assertEqual(csv_header_fields(header), ['id', 'desc'])
+        parsed = []
+        with self.assertRaises(CsvSplitError) as raised:
+            for start, end in pieces:
+                parsed.append(list(iter_piece_rows(self.file_path, start, end)))
+        # Pieces before the wrong boundary are complete, the rest parses serially
+        start = raised.exception.start
+        self.assertEqual(pieces[len(parsed)][0], start)
+        parsed = [row for piece_rows in parsed for row in piece_rows]
+        with open_csv_at(self.file_path, start) as f:
+            parsed.extend(csv.reader(f))
+        self.assertEqual(parsed, rows[1:])
+
+    def test_csv_header_fields(self):
+        self.assertEqual(csv_header_fields(b'a;"b\nc"\n', delimiter=';'), ['a', 'b\nc'])
+        self.assertEqual(csv_header_fields(b''), None)
+        self.assertRaises(CsvSplitError, csv_header_fields, b'a,"b\n')
+
+    def test_split_csv_header_only(self):
+        with open(self.file_path, 'wb') as f:
+            f.write(b'id,"a\nb"')
+        self.assertEqual(split_csv(self.file_path, read_size=3), (b'id,"a\nb"', []))
+
+    def test_map_csv_pieces(self):
+        header, pieces = split_csv(self.file_path, piece_size=100)
+        counts = list(map_csv_pieces(count_rows, self.file_path, pieces, processes=2))
+        self.assertEqual(sum(counts), len(self.rows) - 1)
+        unordered = map_csv_pieces(count_rows, self.file_path, pieces, processes=2, ordered=False)
+        self.assertEqual(sorted(unordered), sorted(counts))
+
+
+if __name__ == "__main__":
+    unittest.main()
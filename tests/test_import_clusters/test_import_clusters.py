@@ -0,0 +1,34 @@
+import os
+import json
+import tempfile
+import unittest
+import common.import_clusters as mod
+
+
+class TestModule(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def test_get_cluster_json(self):
+        csv_filepath = os.path.join(self.test_dir, 'testfile.csv')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_filepath = os.path.join(tmp_dir, 'clusters.json')
+            mod.get_cluster_json(csv_filepath=csv_filepath,
+                                 json_filepath=json_filepath,
+                                 unified_dataset_name='unified "dataset"',
+                                 unique_id_column_name='record_id',
+                                 tamr_cluster_id_col='cluster_id',
+                                 recipe_id=3)
+            with open(json_filepath) as f:
+                clusters = [json.loads(line) for line in f]
+
+        self.assertEqual(clusters, [
+            {'datasetName': 'unified "dataset"', 'recordId': 'say "hi"', 'clusterId': 'c1-recipe_3'},
+            {'datasetName': 'unified "dataset"', 'recordId': 'back\\slash', 'clusterId': 'c2-recipe_3'},
+            {'datasetName': 'unified "dataset"', 'recordId': 'plain', 'clusterId': 'c,3-recipe_3'},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,403 @@
+import io
+import os
+import csv
+import json
+import collections
+import tempfile
+import unittest
+from unittest import mock
+import common.tamr_api_methods as mod
+
+
+class TestModule(unittest.TestCase):
+
+    def setUp(self):
+        self.fieldnames = ['id', 'name', 'note']
+        self.rows = [['1', 'plain', ''],
+                     ['2', 'say "hi"', 'back\\slash'],
+                     ['3', 'café ☃ \U0001F600', 'line\nbreak\ttab\x01'],
+                     ['4', 'short'],
+                     ['5', 'long', 'row', 'extra', 'values'],
+                     ['ünicode "id"', '', '']]
+
+    def expected(self, fieldnames, record_id, values):
+        # What json.dumps gives for a csv.DictReader row
+        record = dict(zip(fieldnames, values))
+        if len(values) > len(fieldnames):
+            record[None] = values[len(fieldnames):]
+        for name in fieldnames[len(values):]:
+            record[name] = None
+        return (json.dumps({'action': 'CREATE', 'recordId': record_id, 'record': record}) + '\n').encode('utf-8')
+
+    def test_create_line_encoder_json(self):
+        for fieldnames in (self.fieldnames, ['id', 'name', 'id']):
+            encoder = mod.CreateLineEncoder(fieldnames, backend='json')
+            for index, values in enumerate(self.rows):
+                for record_id in (values[0], index + 1):
+                    self.assertEqual(encoder.encode(record_id, values),
+                                     self.expected(fieldnames, record_id, values))
+
+    @unittest.skipIf(mod.orjson is None, "orjson is not installed")
+    def test_create_line_encoder_orjson(self):
+        # orjson writes compact utf-8 instead of escaped ascii, so compare the parsed lines
+        for fieldnames in (self.fieldnames, ['id', 'name', 'id']):
+            encoder = mod.CreateLineEncoder(fieldnames, backend='orjson')
+            for index, values in enumerate(self.rows):
+                for record_id in (values[0], index + 1):
+                    line = encoder.encode(record_id, values)
+                    self.assertTrue(line.endswith(b'\n'))
+                    self.assertEqual(json.loads(line), json.loads(self.expected(fieldnames, record_id, values)))
+
+
+    def test_iter_json_array_split(self):
+        # Split at every byte, so chunk boundaries fall inside numbers at '.'
+        # and 'e', inside literals and inside multi-byte characters
+        for text in ('[-15000000000.0, null]', '[1e5, 2.5E-3 ,-0, 10]', ' [ ] ',
+                     '[{"a": [1, 2.25]}, "caf\u00e9 \u2603", true, false]', '[12]'):
+            data = text.encode('utf-8')
+            expected = json.loads(text)
+            for offset in range(len(data) + 1):
+                self.assertEqual(list(mod.iter_json_array([data[:offset], data[offset:]])), expected)
+            self.assertEqual(list(mod.iter_json_array(data[i:i + 1] for i in range(len(data)))), expected)
+
+    def test_iter_json_array_invalid(self):
+        for text in ('[1, 2', '[1 2]', '{"a": 1}', '[1,,2]'):
+            with self.assertRaises(ValueError):
+                list(mod.iter_json_array([text.encode('utf-8')]))
+
+
+    @unittest.skipIf(mod.pyarrow is None, 'pyarrow is not installed')
+    def test_write_columnar(self):
+        # id looks numeric in the first block, but not in a later one
+        data = 'id,"na""me",price\n' + ''.join('{0},n{0},{0}.5\n'.format(i) for i in range(200)) + 'x-1,"a\nb",1\n'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'export.csv')
+            with open(csv_path, 'w', newline='') as f:
+                f.write(data)
+            out_dir = os.path.join(tmp_dir, 'out')
+            report = mod.write_columnar(csv_path, out_dir, column_types={'price': mod.pyarrow.float64()},
+                                        rows_per_file=100, block_size=256)
+            table = mod.pyarrow.parquet.read_table(out_dir)
+        self.assertEqual(report['rows'], 201)
+        self.assertEqual(table.schema.names, ['id', 'na"me', 'price'])
+        self.assertEqual(table.schema.field('id').type, mod.pyarrow.string())
+        self.assertEqual(table.schema.field('price').type, mod.pyarrow.float64())
+        self.assertEqual(table.column('id').to_pylist()[-1], 'x-1')
+        self.assertEqual(table.column('na"me').to_pylist()[-1], 'a\nb')
+
+    @unittest.skipIf(mod.pyarrow is None, 'pyarrow is not installed')
+    def test_write_columnar_header_only(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            report = mod.write_columnar(io.BytesIO(b'id,name\n'), out_dir, file_format='arrow')
+            self.assertEqual((report['rows'], report['files']), (0, 0))
+            self.assertEqual(os.listdir(out_dir), [])
+
+
+    def test_upload_chunks_continue_on_error(self):
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        lines = ['{{"id": {0}}}\n'.format(i) for i in range(10)]
+        rejected = collections.namedtuple('Response', ['status_code', 'text'])(400, 'bad record')
+        accepted = collections.namedtuple('Response', ['status_code', 'text'])(200, '')
+
+        def post(name, body):
+            return rejected if b'"id": 3}' in body else accepted
+
+        commits = []
+        report = api.upload_chunks('ds', lines, chunk_records=2, workers=3, post=post, continue_on_error=True,
+                                   on_commit=lambda records, offset: commits.append(records))
+        self.assertEqual((report['chunks'], report['records'], report['failed']), (4, 8, 2))
+        self.assertEqual([(failure['first_record'], failure['num_records']) for failure in report['failures']],
+                         [(2, 2)])
+        # Records after the failed chunk are never committed
+        self.assertEqual(commits, [2])
+        self.assertRaises(Exception, api.upload_chunks, 'ds', lines, chunk_records=2, post=post)
+
+
+    def test_parallel_json_create_lines_stray_quote(self):
+        # The bare quote in 12" misleads split_csv, so the pieces from the first
+        # wrong boundary on are parsed serially instead
+        lines = ['id,desc\r\n'] + ['{0},"multi\nline {0}"\r\n'.format(i) if i % 7 == 3 else
+                                   '{0},plain\r\n'.format(i) for i in range(40)]
+        lines[6] = '5,12" pipe\r\n'
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'records.csv')
+            with open(csv_path, 'w', newline='') as f:
+                f.write(''.join(lines))
+            serial = b''.join(api.json_create_lines(csv_path, 'id'))
+            self.assertEqual(len(serial.splitlines()), 40)
+            for id_field, ordered in (('id', True), ('id', False), ('', True)):
+                parallel = b''.join(api.parallel_json_create_lines(csv_path, id_field, processes=2, piece_size=50,
+                                                                   ordered=ordered))
+                expected = b''.join(api.json_create_lines(csv_path, id_field))
+                self.assertEqual(sorted(parallel.splitlines()), sorted(expected.splitlines()))
+
+
+    def test_get_records_in_clusters_batched(self):
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        pages = []
+
+        def get_cluster_records_page(unified_dataset_name, cluster_ids, offset, limit, sort_by_spend='false'):
+            pages.append((list(cluster_ids), offset))
+            records = [{'c': '1', 'n': 1}, {'c': '2', 'n': 2}, {'c': '1', 'n': 3}, {'c': '9', 'n': 4}]
+            return mock.Mock(json=mock.Mock(return_value=records[offset:offset + limit]))
+
+        api.get_cluster_records_page = get_cluster_records_page
+        with self.assertLogs(level='WARNING'):
+            clusters = list(api.get_records_in_clusters('ud', [1, 2], limit=3, clusters_per_request=2,
+                                                        cluster_field='c'))
+        self.assertEqual(pages, [([1, 2], 0), ([1, 2], 3)])
+        self.assertEqual([(cluster_id, [record['n'] for record in records]) for cluster_id, records in clusters],
+                         [(1, [1, 3]), (2, [2])])
+
+
+    def test_ensure_export(self):
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        # The dataset is updated to version 6 while the export of version 5 starts
+        api.get_dataset_version = mock.Mock(return_value=5)
+        api.get_export_revision = mock.Mock(side_effect=[4, None, 6])
+        api.materialize_dataset_export = mock.Mock(return_value=mock.Mock(json=mock.Mock(return_value={})))
+        with mock.patch.object(mod.time, 'sleep'):
+            self.assertEqual(api.ensure_export('ds'), 6)
+        self.assertEqual(api.materialize_dataset_export.call_count, 1)
+
+        api.get_export_revision = mock.Mock(return_value=4)
+        api.materialize_dataset_export.return_value.json.return_value = {'documentId': {'id': '12'}}
+        api.get_job = mock.Mock(return_value=mock.Mock(json=mock.Mock(
+            return_value={'data': {'status': {'state': 'FAILED'}}})))
+        with mock.patch.object(mod.time, 'sleep') as sleep, self.assertLogs(level='ERROR'):
+            self.assertRaises(Exception, api.ensure_export, 'ds')
+        api.get_job.assert_called_once_with('12')
+        sleep.assert_not_called()
+
+    def test_get_export_file_revision(self):
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        api.dataset_id = mock.Mock(return_value='7')
+        api.get_dataset_version = mock.Mock(return_value=5)
+        api.ensure_export = mock.Mock(return_value=6)
+        api.download_dataset_export = mock.Mock(side_effect=lambda name, file_path: open(file_path, 'w').close())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = api.get_export_file('ds', tmp_dir)
+            self.assertEqual(os.path.basename(file_path), '7-r6.csv')
+            self.assertEqual(os.listdir(tmp_dir), ['7-r6.csv'])
+
+
+    def test_upload_journal(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            journal_path = os.path.join(tmp_dir, 'journal.json')
+            journal = mod.UploadJournal(journal_path)
+            self.assertEqual((journal.committed_records('ds', 'abc'), journal.committed_offset('ds', 'abc')),
+                             (0, None))
+            journal.commit('ds', 'abc', 100, 2048)
+            reopened = mod.UploadJournal(journal_path)
+            self.assertEqual((reopened.committed_records('ds', 'abc'), reopened.committed_offset('ds', 'abc')),
+                             (100, 2048))
+            # A changed file has another fingerprint and starts from zero
+            self.assertEqual(reopened.committed_records('ds', 'def'), 0)
+            reopened.clear('ds', 'abc')
+            self.assertEqual(mod.UploadJournal(journal_path).committed_records('ds', 'abc'), 0)
+
+    def test_update_dataset_chunked_resume(self):
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        sent = []
+        reject = [b'"name 6"']
+
+        def post_update_chunk(dataset_name, body):
+            sent.append(body)
+            rejected = any(text in body for text in reject)
+            return mock.Mock(status_code=400 if rejected else 200, text='')
+
+        api.post_update_chunk = post_update_chunk
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'records.csv')
+            journal_path = os.path.join(tmp_dir, 'journal.json')
+            with open(csv_path, 'w', newline='') as f:
+                f.write('id,name\n' + ''.join('{0},name {0}\n'.format(i) for i in range(10)))
+            with self.assertLogs(level='ERROR'):
+                self.assertRaises(Exception, api.update_dataset_chunked, 'ds', csv_path, 'id', chunk_records=2,
+                                  workers=1, journal_path=journal_path)
+
+            # Chunks of records 0-5 were acknowledged before the one with record 6 was rejected
+            journal = mod.UploadJournal(journal_path)
+            fingerprint = mod.file_fingerprint(csv_path)
+            self.assertEqual(journal.committed_records('ds', fingerprint), 6)
+            with open(csv_path + '.json', 'rb') as f:
+                lines = f.readlines()
+            self.assertEqual(journal.committed_offset('ds', fingerprint), sum(map(len, lines[:6])))
+
+            del sent[:]
+            del reject[:]
+            report = api.update_dataset_chunked('ds', csv_path, 'id', chunk_records=2, workers=1,
+                                                journal_path=journal_path)
+            self.assertEqual(report['records'], 4)
+            self.assertEqual(b''.join(sent), b''.join(lines[6:]))
+            self.assertEqual(mod.UploadJournal(journal_path).committed_records('ds', fingerprint), 0)
+
+    def test_delta_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = os.path.join(tmp_dir, 'index.csv')
+            # Enough ids to fill the table up to its load factor, so slots collide
+            digests = {'id {0}'.format(i): mod.record_digest([str(i)]) for i in range(1000)}
+            with open(index_path, 'w', newline='') as f:
+                csv.writer(f).writerows([record_id, digest.hex()] for record_id, digest in digests.items())
+            index = mod.DeltaIndex(index_path)
+            for i in range(0, 1000, 2):
+                self.assertEqual(index.pop('id {0}'.format(i)), digests['id {0}'.format(i)])
+            self.assertIsNone(index.pop('id 0'))
+            self.assertIsNone(index.pop('missing'))
+            self.assertEqual(list(index.unseen()), ['id {0}'.format(i) for i in range(1, 1000, 2)])
+            self.assertEqual(list(mod.DeltaIndex(os.path.join(tmp_dir, 'none.csv')).unseen()), [])
+
+    def test_json_delta_lines(self):
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'records.csv')
+            index_path = os.path.join(tmp_dir, 'index.csv')
+
+            def delta(text):
+                with open(csv_path, 'w', newline='') as f:
+                    f.write(text)
+                lines = [json.loads(line) for line in api.json_delta_lines(csv_path, 'id', index_path)]
+                os.replace(index_path + '.new', index_path)
+                return sorted((line['action'], line['recordId'], line.get('record')) for line in lines)
+
+            # Without a previous index every record is new
+            self.assertEqual(delta('id,name\n1,a\n2,b\n3,c\n4,d\n'),
+                             [('CREATE', str(i), {'id': str(i), 'name': name}) for i, name in
+                              zip(range(1, 5), 'abcd')])
+            # 2 changed, 3 deleted, 4 lost a value, 5 is new and 1 is unchanged
+            self.assertEqual(delta('id,name\n1,a\n2,B\n\n4\n5,e\n'),
+                             [('CREATE', '2', {'id': '2', 'name': 'B'}),
+                              ('CREATE', '4', {'id': '4', 'name': None}),
+                              ('CREATE', '5', {'id': '5', 'name': 'e'}),
+                              ('DELETE', '3', None)])
+            self.assertEqual(delta('id,name\n1,a\n2,B\n4\n5,e\n'), [])
+
+
+    def test_wait_for_jobs(self):
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        clock = [100.0]
+        polls = collections.defaultdict(list)
+        states = {'a': ['PENDING', 'RUNNING', 'RUNNING', 'RUNNING', 'SUCCEEDED'], 'b': ['FAILED'],
+                  'c': ['RUNNING'] * 10}
+
+        def get_job(job_id):
+            polls[job_id].append(clock[0] - 100)
+            response = mock.Mock()
+            response.json.return_value = {'data': {'status': {'state': states[job_id].pop(0)}}}
+            return response
+
+        def sleep(seconds):
+            self.assertGreater(seconds, 0)
+            clock[0] += seconds
+
+        api.get_job = get_job
+        changes = []
+        with mock.patch.object(mod.time, 'time', lambda: clock[0]), \
+                mock.patch.object(mod.time, 'sleep', side_effect=sleep):
+            results = api.wait_for_jobs(['a', 'b'], min_poll_interval_seconds=1, max_poll_interval_seconds=4,
+                                        backoff=2, jitter=0,
+                                        on_state_change=lambda job_id, state, _: changes.append((job_id, state)))
+            self.assertEqual({job_id: succeeded for job_id, (succeeded, _) in results.items()},
+                             {'a': True, 'b': False})
+            # Intervals of 1, 2, 4 and then the maximum of 4
+            self.assertEqual(polls['a'], [0, 1, 3, 7, 11])
+            self.assertEqual(polls['b'], [0])
+            self.assertEqual(changes, [('a', 'PENDING'), ('b', 'FAILED'), ('a', 'RUNNING'), ('a', 'SUCCEEDED')])
+
+            # The last sleep is cut short at the timeout
+            clock[0] = 100.0
+            with self.assertRaises(TimeoutError), self.assertLogs(level='ERROR'):
+                api.wait_for_jobs(['c'], timeout_seconds=10, min_poll_interval_seconds=1,
+                                  max_poll_interval_seconds=4, backoff=2, jitter=0)
+            self.assertEqual(polls['c'], [0, 1, 3, 7])
+            self.assertEqual(clock[0], 110)
+
+
+    def test_get_latest_job_id_recent_jobs(self):
+        api = mod.TamrAPI.__new__(mod.TamrAPI)
+        api.recent_jobs = []
+        jobs = [('3', 'profile x'), ('2', 'profile a'), ('1', 'profile b')]
+        read = []
+
+        def get_jobs():
+            def chunks():
+                for i, (job_id, description) in enumerate(jobs):
+                    read.append(job_id)
+                    job = {'documentId': {'id': job_id}, 'data': {'description': description}}
+                    yield ('[' if i == 0 else '') + json.dumps(job) + (']' if i == len(jobs) - 1 else ',')
+            del read[:]
+            response = mock.Mock()
+            response.iter_content.return_value = (chunk.encode() for chunk in chunks())
+            return response
+
+        api.get_jobs = get_jobs
+        # Stops at the first match
+        self.assertEqual(api.get_latest_job_id('profile a'), '2')
+        self.assertEqual(read, ['3', '2'])
+        self.assertEqual(api.recent_jobs, [('3', 'profile x'), ('2', 'profile a')])
+        # Matches among the remembered jobs once the listing reaches them
+        jobs.insert(0, ('4', 'profile c'))
+        self.assertEqual(api.get_latest_job_id('profile a'), '2')
+        self.assertEqual(read, ['4', '3'])
+        self.assertEqual(api.recent_jobs, [('4', 'profile c'), ('3', 'profile x'), ('2', 'profile a')])
+        # A match before the remembered jobs may leave a gap, so they are dropped
+        jobs.insert(0, ('5', 'profile d'))
+        self.assertEqual(api.get_latest_job_id('profile'), '5')
+        self.assertEqual(api.recent_jobs, [('5', 'profile d')])
+        self.assertEqual(api.get_latest_job_id('profile x'), '3')
+        self.assertEqual(read, ['5', '4', '3'])
+        # Reads past the remembered jobs for older ones
+        self.assertEqual(api.get_latest_job_id('profile b'), '1')
+        self.assertIsNone(api.get_latest_job_id('missing'))
+        self.assertEqual(read, ['5', '4', '3', '2', '1'])
+        self.assertEqual([job_id for job_id, _ in api.recent_jobs], ['5', '4', '3', '2', '1'])
+        # A listing that starts over, e.g. after the jobs were deleted, replaces them
+        jobs[:] = [('6', 'profile e')]
+        self.assertIsNone(api.get_latest_job_id('profile a'))
+        self.assertEqual(api.recent_jobs, [('6', 'profile e')])
+
+
+    def test_download_dataset_export_restart(self):
+        data = bytes(range(256)) * 4
+        for supports_range in (True, False):
+            api = mod.TamrAPI.__new__(mod.TamrAPI)
+            api.dataset_id = lambda name: '1'
+            offsets = []
+
+            def get_export_stream(dataset_id, offset=0):
+                offsets.append(offset)
+                response = mock.Mock()
+                start = offset if supports_range else 0
+                response.status_code = 206 if offset and supports_range else 200
+                response.headers = {'Content-Length': str(len(data) - start)}
+                if response.status_code == 206:
+                    response.headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, len(data) - 1, len(data))
+                failing = len(offsets) < 3
+
+                def iter_content(chunk_size):
+                    for position in range(start, len(data), chunk_size):
+                        # The first two connections drop after 300 bytes of new data
+                        if failing and position >= max(offset, start) + 300:
+                            raise mod.requests.exceptions.ConnectionError('reset')
+                        yield data[position:position + chunk_size]
+                response.iter_content = iter_content
+                return response
+
+            api.get_export_stream = get_export_stream
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                file_path = os.path.join(tmp_dir, 'export.csv')
+                with mock.patch.object(mod.time, 'sleep') as sleep, \
+                        self.assertLogs(level='WARNING'), mock.patch('builtins.print'):
+                    report = api.download_dataset_export('ds', file_path, chunk_size=100, num_tries=3)
+                with open(file_path, 'rb') as f:
+                    self.assertEqual(f.read(), data)
+                self.assertFalse(os.path.exists(file_path + '.part'))
+            self.assertEqual(offsets, [0, 300, 600])
+            self.assertEqual(sleep.call_count, 2)
+            self.assertEqual((report['bytes'], report['tries']), (len(data), 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,7 @@ import os
 import errno
 import argparse
 import datetime
-from common.tamr_api_methods import TamrAPI
+from common.tamr_api_methods import TamrAPI, UploadJournal, DEFAULT_CHUNK_RECORDS, file_fingerprint
 
 
 def is_valid_file(filename):
@@ -13,24 +13,48 @@ def is_valid_file(filename):
         return filename
 
 
-def truncate_load(host, protocol, port, username, password, dataset_name, csv_filepath, id_field, create_json=True):
+def truncate_load(host, protocol, port, username, password, dataset_name, csv_filepath, id_field, create_json=True, streaming=False,
+                  workers=None, chunk_records=None, resume=False, processes=None):
 
     start = datetime.datetime.now()
 
     csv_filepath = is_valid_file(csv_filepath)
 
-    # Truncate dataset. 
-    with TamrAPI(host, protocol, port, username, password) as api:
-        response = api.truncate_dataset(dataset_name)
-    print(response.json())
+    workers = workers or (4 if resume else None)
 
-    # Upload records. 
-    with TamrAPI(host, protocol, port, username, password) as api:
-        response = api.update_dataset(dataset_name=dataset_name,
-                                      file_name=csv_filepath,
-                                      id_field=id_field,
-                                      create_json=create_json)
-    print(response.json())
+    # One client for both steps, with a connection per concurrent upload
+    with TamrAPI(host, protocol, port, username, password, pool_size=workers) as api:
+
+        # A journal with progress for this file means a previous load was interrupted
+        # after truncating, so the dataset must not be truncated again.
+        journal_path = csv_filepath + '.journal' if resume else None
+        if resume and UploadJournal(journal_path).committed_records(dataset_name, file_fingerprint(csv_filepath)):
+            print('Resuming interrupted load, skipping truncate')
+        else:
+            # Truncate dataset. 
+            response = api.truncate_dataset(dataset_name)
+            print(response.json())
+
+        # Upload records. 
+        if workers:
+            report = api.update_dataset_chunked(dataset_name=dataset_name,
+                                                file_path=csv_filepath,
+                                                id_field=id_field,
+                                                create_json=create_json,
+                                                streaming=streaming,
+                                                chunk_records=chunk_records or DEFAULT_CHUNK_RECORDS,
+                                                workers=workers,
+                                                journal_path=journal_path,
+                                                processes=processes)
+            print(report)
+        else:
+            response = api.update_dataset(dataset_name=dataset_name,
+                                          file_path=csv_filepath,
+                                          id_field=id_field,
+                                          create_json=create_json,
+                                          streaming=streaming,
+                                          processes=processes)
+            print(response.json())
 
     end = datetime.datetime.now()
     duration = round((end - start).seconds / 60, 3)
@@ -58,6 +82,16 @@ if __name__ == '__main__':
                         help='ID field')
     parser.add_argument('--create_json', type=bool, default=True,
                         help='false if latest JSON file already exists. Default is true')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Convert and upload the csv in one pass without writing a JSON file')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Upload in chunks over this many concurrent requests, with per-chunk retry')
+    parser.add_argument('--chunk_records', type=int, default=None,
+                        help='Records per chunk when --workers is set, defaults to {}'.format(DEFAULT_CHUNK_RECORDS))
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of processes used to parse the csv, default is 1')
+    parser.add_argument('--resume', action='store_true',
+                        help='Checkpoint progress to <csv_filepath>.journal and resume an interrupted upload')
 
     args = parser.parse_args()
     truncate_load(host=args.host,
@@ -68,4 +102,9 @@ if __name__ == '__main__':
                   dataset_name=args.dataset_name,
                   csv_filepath=args.csv_filepath,
                   id_field=args.id_field,
-                  create_json=args.create_json)
+                  create_json=args.create_json,
+                  streaming=args.streaming,
+                  workers=args.workers,
+                  chunk_records=args.chunk_records,
+                  resume=args.resume,
+                  processes=args.processes)
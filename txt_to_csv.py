@@ -1,11 +1,50 @@
+import io
 import csv
+import logging
 import argparse
+from common.csv_pieces import split_csv, iter_piece_rows, map_csv_pieces, csv_header_fields, open_csv_at, \
+    CsvSplitError
 
 
-def txt_to_csv(infile, outfile, input_encoding='utf-8', output_encoding='utf-8', input_delimiter=',', output_delimiter=','):
-    with open(infile, 'r', encoding=input_encoding) as inputfile:
-        with open(outfile, 'w', encoding=output_encoding) as outputfile:
-            csv_reader = csv.DictReader(inputfile, delimiter=input_delimiter)
+def convert_piece(file_path, start, end, input_encoding, input_delimiter, output_delimiter, fieldnames):
+    # Same newline translation as the file opened in text mode below
+    rows = iter_piece_rows(file_path, start, end, encoding=input_encoding, newline=None, delimiter=input_delimiter)
+    output = io.StringIO()
+    csv_writer = csv.DictWriter(output, delimiter=output_delimiter, fieldnames=fieldnames)
+    for values in rows:
+        if not values:
+            continue
+        # The row csv.DictReader would make of these values
+        row = dict(zip(fieldnames, values))
+        if len(values) > len(fieldnames):
+            row[None] = values[len(fieldnames):]
+        csv_writer.writerow(row)
+    return output.getvalue()
+
+
+def txt_to_csv(infile, outfile, input_encoding='utf-8', output_encoding='utf-8', input_delimiter=',', output_delimiter=',',
+               processes=None):
+    with open(outfile, 'w', encoding=output_encoding) as outputfile:
+        offset = 0
+        fieldnames = None
+        if processes and processes > 1:
+            # Pieces are split on raw bytes, so the input encoding must be ASCII-compatible
+            header, pieces = split_csv(infile)
+            try:
+                fieldnames = csv_header_fields(header, encoding=input_encoding, delimiter=input_delimiter)
+                for text in map_csv_pieces(convert_piece, infile, pieces,
+                                           args=(input_encoding, input_delimiter, output_delimiter, fieldnames),
+                                           processes=processes):
+                    outputfile.write(text)
+                return
+            except CsvSplitError as e:
+                # A quote inside an unquoted field misled split_csv. The pieces
+                # before e.start are written, the rest is read serially.
+                logging.warning("{0}, reading {1} serially from byte {2}".format(e, infile, e.start))
+                offset = e.start
+
+        with open_csv_at(infile, offset, encoding=input_encoding, newline=None) as inputfile:
+            csv_reader = csv.DictReader(inputfile, delimiter=input_delimiter, fieldnames=fieldnames)
             csv_writer = csv.DictWriter(outputfile, delimiter=output_delimiter, fieldnames=csv_reader.fieldnames)
             for row in csv_reader:
                 csv_writer.writerow(row)
@@ -19,6 +58,7 @@ if __name__ == "__main__":
     parser.add_argument('--output_encoding', type=str, required=False, default='utf-8')
     parser.add_argument('--input_delimiter', type=str, required=False, default=',')
     parser.add_argument('--output_delimiter', type=str, required=False, default=',')
+    parser.add_argument('--processes', type=int, required=False, default=None)
 
     args = parser.parse_args()
     txt_to_csv(infile=args.infile,
@@ -26,4 +66,5 @@ if __name__ == "__main__":
                input_encoding=args.input_encoding,
                output_encoding=args.output_encoding,
                input_delimiter=args.input_delimiter,
-               output_delimiter=args.output_delimiter)
+               output_delimiter=args.output_delimiter,
+               processes=args.processes)
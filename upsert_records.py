@@ -1,7 +1,7 @@
 import os
 import errno
 import argparse
-from common.tamr_api_methods import TamrAPI
+from common.tamr_api_methods import TamrAPI, DEFAULT_CHUNK_RECORDS
 
 
 def is_valid_file(filename):
@@ -12,18 +12,46 @@ def is_valid_file(filename):
         return filename
 
 
-def upsert_records(host, protocol, port, username, password, dataset_name, csv_filepath, id_field, create_json=True):
+def upsert_records(host, protocol, port, username, password, dataset_name, csv_filepath, id_field, create_json=True, streaming=False,
+                   workers=None, chunk_records=None, resume=False, delta_index=None,
+                   processes=None):
 
     # Check valid path
     csv_filepath = is_valid_file(csv_filepath)
 
-    # Update dataset
-    with TamrAPI(host, protocol, port, username, password) as api:
-        update_response = api.update_dataset(dataset_name=dataset_name,
-                                             csv_filepath=csv_filepath,
-                                             id_field=id_field,
-                                             create_json=create_json)
-    print(update_response.json())
+    journal_path = csv_filepath + '.journal' if resume else None
+
+    workers = workers or (4 if resume or delta_index else None)
+
+    # Update dataset, with a connection per concurrent upload
+    with TamrAPI(host, protocol, port, username, password, pool_size=workers) as api:
+        if delta_index:
+            report = api.update_dataset_delta(dataset_name=dataset_name,
+                                              file_path=csv_filepath,
+                                              id_field=id_field,
+                                              index_path=delta_index,
+                                              chunk_records=chunk_records or DEFAULT_CHUNK_RECORDS,
+                                              workers=workers)
+            print(report)
+        elif workers:
+            report = api.update_dataset_chunked(dataset_name=dataset_name,
+                                                file_path=csv_filepath,
+                                                id_field=id_field,
+                                                create_json=create_json,
+                                                streaming=streaming,
+                                                chunk_records=chunk_records or DEFAULT_CHUNK_RECORDS,
+                                                workers=workers,
+                                                journal_path=journal_path,
+                                                processes=processes)
+            print(report)
+        else:
+            update_response = api.update_dataset(dataset_name=dataset_name,
+                                                 file_path=csv_filepath,
+                                                 id_field=id_field,
+                                                 create_json=create_json,
+                                                 streaming=streaming,
+                                                 processes=processes)
+            print(update_response.json())
 
 
 if __name__ == '__main__':
@@ -47,6 +75,19 @@ if __name__ == '__main__':
                         help='ID field')
     parser.add_argument('--create_json', type=bool, default=True,
                         help='false if latest JSON file already exists. Default is true')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Convert and upload the csv in one pass without writing a JSON file')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Upload in chunks over this many concurrent requests, with per-chunk retry')
+    parser.add_argument('--chunk_records', type=int, default=None,
+                        help='Records per chunk when --workers is set, defaults to {}'.format(DEFAULT_CHUNK_RECORDS))
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of processes used to parse the csv, default is 1')
+    parser.add_argument('--resume', action='store_true',
+                        help='Checkpoint progress to <csv_filepath>.journal and resume an interrupted upload')
+    parser.add_argument('--delta_index', type=str, default=None,
+                        help='Path to index of the previous load. If set, only new or changed records are '
+                             'sent and records missing from the csv are deleted. Requires --id_field')
 
     args = parser.parse_args()
     upsert_records(host=args.host,
@@ -57,4 +98,10 @@ if __name__ == '__main__':
                    dataset_name=args.dataset_name,
                    csv_filepath=args.csv_filepath,
                    id_field=args.id_field,
-                   create_json=args.create_json)
+                   create_json=args.create_json,
+                   streaming=args.streaming,
+                   workers=args.workers,
+                   chunk_records=args.chunk_records,
+                   resume=args.resume,
+                   delta_index=args.delta_index,
+                   processes=args.processes)